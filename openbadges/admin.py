@@ -41,18 +41,58 @@ show_image.short_description = _("Image")
 class BadgeAdmin(admin.ModelAdmin):
     model = Badge
     prepopulated_fields = {'slug': ('title', )}
-    list_display = ('title', show_image, 'created',)
+    list_display = ('title', show_image, 'created', 'awarded_count',
+                    'revoked_count', 'active_count')
+
+
+class RevokedListFilter(admin.SimpleListFilter):
+    title = _('revoked')
+    parameter_name = 'revoked'
+
+    def lookups(self, request, model_admin):
+        return (('yes', _('Yes')), ('no', _('No')))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.revoked()
+        if self.value() == 'no':
+            return queryset.not_revoked()
+        return queryset
+
+
+class ExpiredListFilter(admin.SimpleListFilter):
+    title = _('expired')
+    parameter_name = 'expired'
+
+    def lookups(self, request, model_admin):
+        return (('yes', _('Yes')), ('no', _('No')))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.expired()
+        if self.value() == 'no':
+            return queryset.not_expired()
+        return queryset
 
 
 class AwardAdmin(admin.ModelAdmin):
     model = Award
     raw_id_fields = ('user',)
     autocomplete_lookup_fields = { 'fk': ['user'], }
-    list_display = ('user', 'badge', show_image, 'awarded', 'revoked')
+    list_display = ('user', 'badge', show_image, 'awarded', 'revoked',
+                    'expired', 'baking_status')
+    list_filter = (RevokedListFilter, ExpiredListFilter, 'baking_status')
+    list_select_related = ('user', 'badge')
+
+    def get_queryset(self, request):
+        return super(AwardAdmin, self).get_queryset(request).with_status()
+
 
 class RevocationAdmin(admin.ModelAdmin):
     model = Revocation
-    list_display = ('award', 'reason',)
+    raw_id_fields = ('award',)
+    list_display = ('award', 'reason', 'created')
+    list_select_related = ('award__badge', 'award__user')
 
 
 class IssuerAdmin(admin.ModelAdmin):
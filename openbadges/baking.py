@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Baking of openbadges assertions into png images.
+
+Instead of decoding and encoding the whole image, the badge png is split
+once in the bytes before the first IDAT chunk and the rest of the file, and
+every baked image is written as prefix + openbadges text chunk + suffix.
+"""
+
+import struct
+import zlib
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+KEYWORD = b'openbadges'
+
+_cache = {}
+
+
+def make_chunk(chunk_type, data):
+    crc = zlib.crc32(chunk_type + data) & 0xffffffff
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', crc)
+
+
+def make_text_chunk(text):
+    """
+    tEXt chunk if the text is latin-1, as PIL did, iTXt otherwise
+    """
+    try:
+        return make_chunk(b'tEXt', KEYWORD + b'\x00' + text.encode('latin-1'))
+    except UnicodeEncodeError:
+        return make_chunk(b'iTXt', KEYWORD + b'\x00\x00\x00\x00\x00' + text.encode('utf-8'))
+
+
+def iter_chunks(data):
+    """
+    Yields (chunk type, chunk data, start offset, end offset) of every
+    chunk, without decompressing anything
+    """
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError('The image is not a png')
+    offset = 8
+    while offset < len(data):
+        if offset + 8 > len(data):
+            raise ValueError('Truncated png chunk')
+        length, chunk_type = struct.unpack('>I4s', data[offset:offset + 8])
+        end = offset + 12 + length
+        if end > len(data):
+            raise ValueError('Truncated png chunk')
+        yield chunk_type, data[offset + 8:offset + 8 + length], offset, end
+        offset = end
+
+
+def is_openbadges_chunk(chunk_type, chunk_data):
+    return (chunk_type in (b'tEXt', b'iTXt') and
+            chunk_data.split(b'\x00', 1)[0] == KEYWORD)
+
+
+def split_png(data):
+    """
+    Returns the bytes before the first IDAT chunk and the bytes from it to
+    the end, leaving out any openbadges chunk already baked in the image
+    """
+    prefix = [PNG_SIGNATURE]
+    for chunk_type, chunk_data, start, end in iter_chunks(data):
+        if chunk_type == b'IDAT':
+            return b''.join(prefix), data[start:]
+        if not is_openbadges_chunk(chunk_type, chunk_data):
+            prefix.append(data[start:end])
+    raise ValueError('The png has no image data')
+
+
+def bake(prefix, suffix, text):
+    return prefix + make_text_chunk(text) + suffix
+
+
+def extract(data):
+    """
+    Returns the text baked in a png, or None
+    """
+    for chunk_type, chunk_data, start, end in iter_chunks(data):
+        if is_openbadges_chunk(chunk_type, chunk_data):
+            if chunk_type == b'tEXt':
+                return chunk_data.split(b'\x00', 1)[1].decode('latin-1')
+            return chunk_data.split(b'\x00', 5)[5].decode('utf-8')
+        if chunk_type == b'IDAT':
+            return None
+    return None
+
+
+def get_badge_parts(badge):
+    """
+    Prefix and suffix of the badge image, parsed only once per badge image
+    """
+    key = (badge.pk, badge.image.name, badge.modified)
+    parts = _cache.get(key)
+    if parts is None:
+        badge.image.open('rb')
+        try:
+            parts = split_png(badge.image.read())
+        finally:
+            badge.image.close()
+        if len(_cache) >= 256:
+            _cache.clear()
+        _cache[key] = parts
+    return parts
+
+
+def bake_badge(badge, text):
+    prefix, suffix = get_badge_parts(badge)
+    return bake(prefix, suffix, text)
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Benchmarks of the award creation, baking and verification paths.
+
+They are run by the openbadges_benchmark command on a throwaway test
+database, and report latency percentiles, queries and memory as JSON so
+the results of two commits can be compared.
+"""
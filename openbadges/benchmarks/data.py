@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Synthetic users, badges, awards and revocations.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+
+import random
+import struct
+import zlib
+
+from openbadges import baking
+from openbadges import identities
+from openbadges import models
+
+
+def make_png(width, height, seed=0):
+    """
+    Noisy RGB png, so the image data doesn't compress to nothing
+    """
+    rnd = random.Random(seed)
+    rows = []
+    for y in range(height):
+        rows.append(b'\x00' + bytes(bytearray(rnd.randrange(256) for x in range(width * 3))))
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b''.join([baking.PNG_SIGNATURE,
+                     baking.make_chunk(b'IHDR', header),
+                     baking.make_chunk(b'IDAT', zlib.compress(b''.join(rows))),
+                     baking.make_chunk(b'IEND', b'')])
+
+
+def create_users(count, prefix='bench'):
+    """
+    Users created in bulk, without signals, and their identities
+    """
+    User = get_user_model()
+    User.objects.bulk_create([
+        User(**{User.USERNAME_FIELD: '{0}{1}'.format(prefix, i),
+                'email': '{0}{1}@example.com'.format(prefix, i)})
+        for i in range(count)
+    ])
+    users = User.objects.filter(**{User.USERNAME_FIELD + '__startswith': prefix})
+    pks = list(users.order_by('pk').values_list('pk', flat=True))
+    identities.sync_range((pks[0], pks[-1]))
+    return pks
+
+
+def create_badge(slug, image_size):
+    badge = models.Badge(title=slug, slug=slug, description='Benchmark badge',
+                         criteria='http://example.com/criteria')
+    badge.image.save(slug + '.png', ContentFile(make_png(image_size, image_size)),
+                     save=False)
+    badge.save()
+    return badge
+
+
+def generate(users=1000, badges=10, awards_per_user=3, revoked=0.05,
+             image_size=128, seed=0):
+    """
+    Creates the dataset and returns a dict with the created badges, the
+    user pks and the award uuids
+    """
+    rnd = random.Random(seed)
+    user_pks = create_users(users)
+    badge_list = [create_badge('bench-{0}'.format(i), image_size)
+                  for i in range(badges)]
+
+    for badge in badge_list:
+        share = min(float(awards_per_user) / max(badges, 1), 1)
+        awardees = [pk for pk in user_pks if rnd.random() < share]
+        models.Award.objects.bulk_award(badge, awardees)
+
+    awards = list(models.Award.objects.order_by('pk').values_list('pk', 'uuid'))
+    revoked_pks = [pk for pk, uuid in awards if rnd.random() < revoked]
+    models.Revocation.objects.bulk_create([
+        models.Revocation(award_id=pk, reason='Benchmark') for pk in revoked_pks])
+
+    return {
+        'badges': badge_list,
+        'users': user_pks,
+        'awards': [uuid for pk, uuid in awards],
+    }
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Scenarios measured by the openbadges_benchmark command. Every scenario gets
+the generated dataset and returns one callable per operation to time.
+"""
+
+from django.db import connection
+from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
+
+import gc
+import random
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2, only the peak RSS of the process is reported
+    tracemalloc = None
+    import resource
+
+from openbadges import baking
+from openbadges import cache
+from openbadges import models
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def summarize(latencies, queries):
+    return {
+        'operations': len(latencies),
+        'latency_ms': {
+            'mean': sum(latencies) / len(latencies) * 1000,
+            'p50': percentile(latencies, 50) * 1000,
+            'p90': percentile(latencies, 90) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'max': max(latencies) * 1000,
+        },
+        'queries': {
+            'mean': float(sum(queries)) / len(queries),
+            'max': max(queries),
+        },
+    }
+
+
+def measure(operations):
+    latencies = []
+    queries = []
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    for operation in operations:
+        with CaptureQueriesContext(connection) as captured:
+            start = time.time()
+            operation()
+            latencies.append(time.time() - start)
+        queries.append(len(captured))
+    result = summarize(latencies, queries)
+    if tracemalloc is not None:
+        result['peak_memory_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    else:
+        result['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def get(client, url, cold=False):
+    if not cold:
+        client.get(url)
+
+    def operation():
+        if cold:
+            cache.get_badges_cache().clear()
+            cache.badge_images.clear()
+        response = client.get(url)
+        # streamed responses are only produced when read
+        if response.streaming:
+            for chunk in response.streaming_content:
+                pass
+    return operation
+
+
+def award_create(data, repeat):
+    from openbadges.benchmarks.data import create_users
+    badge = data['badges'][0]
+    user_pks = create_users(repeat, prefix='award-create')
+    return [lambda pk=pk: models.Award.objects.create(user_id=pk, badge=badge)
+            for pk in user_pks]
+
+
+def bulk_award(data, repeat):
+    from openbadges.benchmarks.data import create_users
+    badge = data['badges'][-1]
+    user_pks = create_users(repeat * 100, prefix='bulk-award')
+    batches = [user_pks[i:i + 100] for i in range(0, len(user_pks), 100)]
+    return [lambda batch=batch: models.Award.objects.bulk_award(badge, batch)
+            for batch in batches]
+
+
+def baking_splice(data, repeat):
+    badge = data['badges'][0]
+    baking._cache.clear()
+    return [lambda i=i: baking.bake_badge(badge, 'http://example.com/assertion/{0}/'.format(i))
+            for i in range(repeat)]
+
+
+def baking_store(data, repeat):
+    awards = list(models.Award.objects.select_related('badge')[:repeat])
+    return [lambda award=award: models.bake_award_image(award) for award in awards]
+
+
+def assertion(cold):
+    def scenario(data, repeat):
+        client = Client()
+        uuids = random.Random(1).sample(data['awards'], min(repeat, len(data['awards'])))
+        return [get(client, '/assertion/{0}/'.format(uuid), cold) for uuid in uuids]
+    return scenario
+
+
+def revocation_list(data, repeat):
+    client = Client()
+    return [get(client, '/revoked/', cold=True) for i in range(repeat)]
+
+
+def user_badges(data, repeat):
+    client = Client()
+    users = list(models.Award.objects.values_list('user', flat=True).distinct()[:repeat])
+    return [get(client, '/user_badges/{0}?format=json'.format(pk), cold=True)
+            for pk in users]
+
+
+def badge_image(cold):
+    def scenario(data, repeat):
+        client = Client()
+        awards = models.Award.objects.values_list('badge__slug', 'user')[:repeat]
+        return [get(client, '/badge_image/{0}/{1}/image'.format(slug, pk), cold)
+                for slug, pk in awards]
+    return scenario
+
+
+SCENARIOS = (
+    ('award_create', award_create),
+    ('bulk_award_100', bulk_award),
+    ('baking_splice', baking_splice),
+    ('baking_store', baking_store),
+    ('assertion_cold', assertion(cold=True)),
+    ('assertion_warm', assertion(cold=False)),
+    ('revocation_list', revocation_list),
+    ('user_badges', user_badges),
+    ('badge_image_cold', badge_image(cold=True)),
+    ('badge_image_warm', badge_image(cold=False)),
+)
+
+
+def run(data, repeat, names=None):
+    results = {}
+    for name, scenario in SCENARIOS:
+        if names and name not in names:
+            continue
+        operations = scenario(data, repeat)
+        if operations:
+            results[name] = measure(operations)
+    return results
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Startup cost of a worker: time and peak RSS of a fresh process that loads a
+WSGI application and resolves an assertion url, which imports its URLconf
+and views. Compares the whole application with openbadges.wsgi.
+"""
+
+from django.conf import settings
+
+import json
+import os
+import subprocess
+import sys
+
+SCRIPT = '''
+import json, resource, sys, time, uuid
+start = time.time()
+module, urlconf = sys.argv[1:]
+if module == 'django.core.wsgi':
+    from django.core.wsgi import get_wsgi_application
+    get_wsgi_application()
+else:
+    __import__(module)
+from django.core.urlresolvers import resolve, reverse
+resolve(reverse('assertion', args=[str(uuid.uuid4())], urlconf=urlconf), urlconf)
+print(json.dumps({
+    'seconds': time.time() - start,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': len(sys.modules),
+}))
+'''
+
+
+def get_entries():
+    return (
+        ('full', 'django.core.wsgi', settings.ROOT_URLCONF),
+        ('verification', 'openbadges.wsgi', 'openbadges.verification_urls'),
+    )
+
+
+def measure_process(module, urlconf):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT, module, urlconf], env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def run(repeat):
+    """
+    Median seconds, peak RSS and loaded modules of every entry point
+    """
+    results = {}
+    for name, module, urlconf in get_entries():
+        runs = [measure_process(module, urlconf) for i in range(repeat)]
+        results[name] = {
+            'seconds': sorted(run['seconds'] for run in runs)[len(runs) // 2],
+            'max_rss_kb': max(run['max_rss_kb'] for run in runs),
+            'modules': runs[-1]['modules'],
+        }
+    return results
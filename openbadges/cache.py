@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Cache of the serialized OBI documents.
+
+It uses the Django cache set in BADGES_CACHE or, by default, a local memory
+cache whose entries expire after 10 seconds. Keys can be grouped in
+namespaces: bumping the version of a namespace invalidates all its keys at
+once.
+"""
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+
+try:
+    from django.core.cache import caches
+except ImportError:
+    # Django < 1.7
+    from django.core.cache import get_cache
+else:
+    get_cache = caches.__getitem__
+
+from collections import OrderedDict
+import threading
+import time
+
+from . import metrics
+
+
+KEY_PREFIX = 'openbadges'
+
+_local_cache = None
+
+
+def get_badges_cache():
+    global _local_cache
+    alias = getattr(settings, 'BADGES_CACHE', None)
+    if alias is not None:
+        return get_cache(alias)
+    if _local_cache is None:
+        _local_cache = LocMemCache('openbadges', {
+            'OPTIONS': {'MAX_ENTRIES': getattr(settings, 'BADGES_LOCAL_CACHE_MAX_ENTRIES', 10000)}
+        })
+    return _local_cache
+
+
+def get_timeout():
+    """
+    The signals only invalidate the cache of the process that fires them,
+    so without a shared BADGES_CACHE the entries live just a few seconds
+    """
+    if getattr(settings, 'BADGES_CACHE', None) is None:
+        return getattr(settings, 'BADGES_CACHE_TIMEOUT', 10)
+    return getattr(settings, 'BADGES_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def make_key(*parts):
+    return ':'.join([KEY_PREFIX] + [str(part) for part in parts])
+
+
+def get_version(namespace):
+    """
+    Current version of the namespace. If the version was evicted it starts
+    again from the current time, never from a value used before.
+    """
+    cache = get_badges_cache()
+    key = make_key('version', namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    cache = get_badges_cache()
+    key = make_key('version', namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def get_entry(namespace, name):
+    value = get_badges_cache().get(make_key(namespace, get_version(namespace), name))
+    # per user namespaces are counted together
+    metrics.inc('openbadges_cache_requests_total', namespace=namespace.split(':')[0],
+                result='miss' if value is None else 'hit')
+    return value
+
+
+def set_entry(namespace, name, value):
+    get_badges_cache().set(make_key(namespace, get_version(namespace), name), value,
+                           get_timeout())
+
+
+def delete_entry(namespace, name):
+    get_badges_cache().delete(make_key(namespace, get_version(namespace), name))
+
+
+class LRUCache(object):
+    """
+    Small in-process cache in front of the shared one. Other processes
+    can't invalidate it, so entries only live for a few seconds.
+    """
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.pop(key, None)
+            if item is None or item[1] < time.time():
+                return None
+            self.data[key] = item
+            return item[0]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (value, time.time() + self.timeout)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+badge_images = LRUCache(getattr(settings, 'BADGES_IMAGE_LRU_SIZE', 10000),
+                        getattr(settings, 'BADGES_IMAGE_LRU_TIMEOUT', 10))
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Helpers to process long sequences and tables in chunks, so memory doesn't
+grow with their size.
+"""
+
+
+def iter_chunks(items, chunk_size):
+    """
+    Yields the items in lists of chunk_size, the last one possibly shorter
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_pages(queryset, after=0, chunk_size=1000):
+    """
+    Yields the rows of the queryset with pk greater than after, in lists of
+    chunk_size in pk order, each one read with a query that starts after the
+    last pk of the previous one. Rows of values_list() must start with the pk.
+    """
+    queryset = queryset.order_by('pk')
+    while True:
+        page = list(queryset.filter(pk__gt=after)[:chunk_size])
+        if page:
+            yield page
+        if len(page) < chunk_size:
+            return
+        last = page[-1]
+        after = last[0] if isinstance(last, tuple) else last.pk
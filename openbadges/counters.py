@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Recount of the award counters of badges and identities, used by the
+openbadges_recount command to repair them after changes that don't fire the
+signals (queryset updates and deletes, raw SQL).
+"""
+
+from django.db.models import Count
+from django.utils import timezone
+
+from . import cache
+from . import chunks
+from . import models
+
+
+def recount_badges():
+    """
+    Fixes the counters of every badge with two grouped queries. Returns the
+    number of badges fixed.
+    """
+    awarded = dict(models.Award.objects.order_by().values_list('badge').annotate(Count('pk')))
+    revoked = dict(models.Award.objects.all().revoked().order_by().values_list('badge').annotate(Count('pk')))
+    fixed = 0
+    badges = models.Badge.objects.values_list('pk', 'slug', 'awarded_count',
+                                              'revoked_count', 'active_count')
+    for pk, slug, awarded_count, revoked_count, active_count in badges:
+        real = (awarded.get(pk, 0), revoked.get(pk, 0), awarded.get(pk, 0) - revoked.get(pk, 0))
+        if (awarded_count, revoked_count, active_count) != real:
+            changes = {'awarded_count': real[0], 'revoked_count': real[1],
+                       'active_count': real[2]}
+            if models.counts_exposed():
+                # the counters are part of the BadgeClass
+                changes['modified'] = timezone.now()
+            models.Badge.objects.filter(pk=pk).update(**changes)
+            cache.delete_entry('badges', slug)
+            fixed += 1
+    return fixed
+
+
+def recount_identities(batch_size=1000):
+    """
+    Fixes the active awards of the identities, reading them in batches by
+    primary key. Returns the number of identities fixed.
+    """
+    identities = models.Identity.objects.values_list('pk', 'user', 'active_count')
+    fixed = 0
+    for rows in chunks.iter_pages(identities, chunk_size=batch_size):
+        active = dict(models.Award.objects.all().not_revoked()
+                                          .filter(user__in=[row[1] for row in rows]).order_by()
+                                          .values_list('user').annotate(Count('pk')))
+        for pk, user_pk, active_count in rows:
+            if active.get(user_pk, 0) != active_count:
+                models.Identity.objects.filter(pk=pk).update(active_count=active.get(user_pk, 0))
+                fixed += 1
+    return fixed
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+JSON Lines export of assertions, badge classes and revocations.
+
+Rows are read in primary key order and in chunks, so memory doesn't grow
+with the table, and every line carries the id to resume from.
+"""
+
+import json
+import zlib
+
+from . import chunks
+from . import models
+
+
+KINDS = ('assertions', 'badges', 'revocations')
+
+
+def iter_objects(queryset, after, chunk_size):
+    for page in chunks.iter_pages(queryset, after, chunk_size):
+        for obj in page:
+            yield obj
+
+
+def iter_documents(kind, after=0, chunk_size=1000):
+    """
+    Yields (id, document) of the given kind with id greater than after
+    """
+    if kind == 'assertions':
+        awards = models.Award.objects.with_status().select_related('badge')
+        for award in iter_objects(awards, after, chunk_size):
+            document = award.to_dict()
+            document['revoked'] = award.revoked
+            yield award.pk, document
+    elif kind == 'badges':
+        for badge in iter_objects(models.Badge.objects.with_related(), after, chunk_size):
+            document = badge.to_dict()
+            document['slug'] = badge.slug
+            yield badge.pk, document
+    elif kind == 'revocations':
+        for pk, uuid, reason in models.Revocation.objects.iter_list(after, chunk_size=chunk_size):
+            yield pk, {'uid': uuid, 'reason': reason}
+    else:
+        raise ValueError('Unknown kind {0}'.format(kind))
+
+
+def iter_lines(kind, after=0, chunk_size=1000):
+    for pk, document in iter_documents(kind, after, chunk_size):
+        yield json.dumps({'id': pk, 'kind': kind, 'document': document}) + '\n'
+
+
+def gzip_stream(lines, level=6):
+    """
+    Compresses a stream of lines into a gzip stream, as it goes
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for line in lines:
+        data = compressor.compress(line.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def resolve_cursor(kind, after=None, after_uuid=None):
+    """
+    The id to resume from, given as an id or, for assertions, as the uuid
+    of the last exported one
+    """
+    if after_uuid:
+        if kind != 'assertions':
+            raise ValueError('Only assertions can be resumed by uuid')
+        after_uuid = models.parse_uuid(after_uuid)
+        if after_uuid is None:
+            raise models.Award.DoesNotExist()
+        return models.Award.objects.filter(uuid=after_uuid).values_list('pk', flat=True).get()
+    return int(after or 0)
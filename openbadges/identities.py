@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Batched creation and rehashing of the identities of existing users, used by
+the openbadges_sync_identities command.
+"""
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from . import chunks
+from . import models
+
+
+def sync_range(bounds, batch_size=1000):
+    """
+    Creates the missing identities and rehashes the outdated ones of the
+    users with primary key in [first, last]. Returns (created, rehashed).
+    """
+    first, last = bounds
+    users = get_user_model().objects.filter(pk__lte=last).values_list('pk', 'email')
+    created = rehashed = 0
+    for rows in chunks.iter_pages(users, first - 1, batch_size):
+        batch_created, batch_rehashed = sync_batch(rows)
+        created += batch_created
+        rehashed += batch_rehashed
+    return created, rehashed
+
+
+def sync_batch(rows):
+    identities = dict((user_pk, (pk, salt, identity_hash)) for pk, user_pk, salt, identity_hash in
+                      models.Identity.objects.filter(user__in=[row[0] for row in rows])
+                                             .values_list('pk', 'user', 'salt', 'identity_hash'))
+    new = []
+    outdated = []
+    for user_pk, email in rows:
+        if user_pk not in identities:
+            salt = models.make_salt()
+            new.append(models.Identity(user_id=user_pk, salt=salt,
+                                       identity_hash=models.make_identity_hash(email, salt)))
+            continue
+        pk, salt, identity_hash = identities[user_pk]
+        if salt is None or identity_hash != models.make_identity_hash(email, salt):
+            salt = models.make_salt()
+            outdated.append((pk, user_pk, salt, models.make_identity_hash(email, salt)))
+
+    # only writes in the transaction, so parallel batches don't deadlock
+    with transaction.atomic():
+        models.Identity.objects.bulk_create(new)
+        for pk, user_pk, salt, identity_hash in outdated:
+            models.Identity.objects.filter(pk=pk).update(salt=salt, identity_hash=identity_hash)
+    for pk, user_pk, salt, identity_hash in outdated:
+        models.invalidate_user_cache(user_pk)
+    return len(new), len(outdated)
+
+
+def split_ranges(first, last, parts):
+    size = max((last - first + 1) // parts, 1)
+    ranges = []
+    while first <= last:
+        ranges.append((first, min(first + size - 1, last)))
+        first += size
+    return ranges
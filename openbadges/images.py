@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Garbage collection of the image files no badge, award or issuer references,
+used by the openbadges_gc_images command.
+"""
+
+import datetime
+import posixpath
+
+from . import chunks
+from . import models
+
+# fields whose files live in the scanned directory
+FIELDS = ((models.Award, 'image'), (models.Badge, 'image'), (models.Issuer, 'image'))
+
+
+def get_storage():
+    return models.Award._meta.get_field('image').storage
+
+
+def iter_files(storage, directory):
+    """
+    Yields the name of every file under the directory, recursively
+    """
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        for path in iter_files(storage, posixpath.join(directory, name)):
+            yield path
+
+
+def referenced(names):
+    found = set()
+    for model, field in FIELDS:
+        found.update(model._default_manager.filter(**{field + '__in': names})
+                                           .values_list(field, flat=True))
+    return found
+
+
+def iter_orphans(directory='badges', min_age=3600, chunk_size=1000):
+    """
+    Yields the files under the directory nobody references, checking them in
+    chunks with one query per field. Files newer than min_age seconds are
+    kept, as their award may not be committed yet.
+    """
+    storage = get_storage()
+    limit = datetime.datetime.now() - datetime.timedelta(seconds=min_age)
+    for chunk in chunks.iter_chunks(iter_files(storage, directory), chunk_size):
+        used = referenced(chunk)
+        for name in chunk:
+            if name not in used and storage.modified_time(name) < limit:
+                yield name
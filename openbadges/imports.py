@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Batched import of awards from CSV or JSON Lines files, used by the
+openbadges_import command.
+
+Every chunk of rows resolves its users and identities with a few set based
+queries and is awarded with Award.objects.bulk_award, grouped by badge.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+import csv
+import datetime
+import io
+import json
+
+from . import cache
+from . import identities
+from . import models
+from . import publish
+
+
+FORMATS = ('csv', 'jsonl')
+USER_FIELDS = ('id', 'email', 'username')
+CONFLICTS = ('skip', 'update')
+
+
+def guess_format(path):
+    if path.endswith('.jsonl') or path.endswith('.json'):
+        return 'jsonl'
+    return 'csv'
+
+
+def iter_rows(stream, format):
+    """
+    Yields a dict with user, badge, evidence and expires for every row
+    """
+    if format == 'csv':
+        for row in csv.DictReader(stream):
+            yield row
+    else:
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # counted as invalid by the importer
+                yield {}
+
+
+def open_rows(path, format):
+    if format == 'csv':
+        # the py2 csv module only reads bytes
+        return open(path, 'rb') if str is bytes else io.open(path, newline='', encoding='utf-8')
+    return io.open(path, encoding='utf-8')
+
+
+def parse_expires(value):
+    if not value:
+        return None
+    expires = parse_datetime(value)
+    if expires is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError('Invalid expiration date: {0}'.format(value))
+        expires = datetime.datetime.combine(date, datetime.time())
+    if settings.USE_TZ and timezone.is_naive(expires):
+        expires = timezone.make_aware(expires, timezone.get_default_timezone())
+    return expires
+
+
+class Importer(object):
+    """
+    Imports chunks of rows, keeping the badges and the counters between them
+    """
+
+    def __init__(self, user_field='id', on_conflict='skip', pool=None):
+        self.user_field = user_field
+        self.on_conflict = on_conflict
+        self.pool = pool
+        self.badges = {}
+        self.created = self.updated = self.skipped = self.invalid = 0
+
+    def get_badges(self, slugs):
+        missing = set(slugs) - set(self.badges)
+        if missing:
+            for badge in models.Badge.objects.filter(slug__in=missing):
+                self.badges[badge.slug] = badge
+            for slug in missing - set(self.badges):
+                self.badges[slug] = None
+        return self.badges
+
+    def get_users(self, keys):
+        """
+        Returns {key: (pk, email)} with one query per chunk
+        """
+        field = 'pk' if self.user_field == 'id' else self.user_field
+        if field == 'pk':
+            keys = [key for key in keys if str(key).isdigit()]
+        rows = (get_user_model().objects.filter(**{field + '__in': keys})
+                                        .values_list(field, 'pk', 'email'))
+        return dict((str(key), (pk, email)) for key, pk, email in rows)
+
+    def import_chunk(self, rows):
+        valid = {}
+        invalid = 0
+        for row in rows:
+            try:
+                key = (str(row['user']).strip(), row['badge'].strip())
+                valid[key] = (row.get('evidence') or None, parse_expires(row.get('expires')))
+            except (KeyError, TypeError, AttributeError, ValueError):
+                invalid += 1
+        # repeated user and badge pairs in the chunk, the last one wins
+        self.skipped += len(rows) - invalid - len(valid)
+        self.invalid += invalid
+
+        users = self.get_users(set(user for user, slug in valid))
+        badges = self.get_badges(set(slug for user, slug in valid))
+        by_badge = {}
+        for (user, slug), values in valid.items():
+            if user not in users or badges[slug] is None:
+                self.invalid += 1
+                continue
+            by_badge.setdefault(slug, {})[users[user][0]] = values
+
+        identities.sync_batch(sorted(set(users.values())))
+        for slug, awards in by_badge.items():
+            self.award(badges[slug], awards)
+
+    def award(self, badge, awards):
+        existing = dict(models.Award.objects.filter(badge=badge, user__in=list(awards))
+                                            .values_list('user', 'uuid'))
+        created = models.Award.objects.bulk_award(
+            badge, [user for user in awards if user not in existing],
+            evidence=dict((user, values[0]) for user, values in awards.items()),
+            expires=dict((user, values[1]) for user, values in awards.items()),
+            pool=self.pool)
+        self.created += len(created)
+        if self.on_conflict == 'skip':
+            self.skipped += len(existing)
+            return
+        for user, uuid in existing.items():
+            evidence, expires = awards[user]
+            models.Award.objects.filter(uuid=uuid).update(
+                evidence=evidence, expires=expires, modified=timezone.now())
+            cache.delete_entry('assertions', uuid)
+            cache.bump_version('user:{0}'.format(user))
+        if publish.is_enabled():
+            for award in (models.Award.objects.with_status().select_related('badge')
+                                              .filter(uuid__in=list(existing.values()))):
+                publish.publish_assertion(award)
+        self.updated += len(existing)
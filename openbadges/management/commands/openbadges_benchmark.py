@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from optparse import make_option
+import django
+import json
+import platform
+
+from openbadges import models
+from openbadges.benchmarks import data, scenarios, startup
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks award creation, baking and the verification views '
+            'on a test database and prints the results as JSON')
+    option_list = BaseCommand.option_list + (
+        make_option('--users', type='int', default=1000),
+        make_option('--badges', type='int', default=10),
+        make_option('--awards-per-user', type='int', default=3,
+                    dest='awards_per_user'),
+        make_option('--revoked', type='float', default=0.05,
+                    help='Share of revoked awards'),
+        make_option('--image-size', type='int', default=128,
+                    dest='image_size', help='Side of the badge images in pixels'),
+        make_option('--repeat', type='int', default=100,
+                    help='Operations measured per scenario'),
+        make_option('--scenario', action='append', dest='scenarios',
+                    help='Run only this scenario, can be repeated'),
+        make_option('--startup-repeat', type='int', default=5, dest='startup_repeat',
+                    help='Processes started to compare the worker startup, 0 to skip'),
+        make_option('--label', default='',
+                    help='Label of the results, e.g. the commit'),
+        make_option('--output', help='Write the results to this file'),
+        make_option('--compare', help='Results of a previous run to compare with'),
+    )
+
+    def handle(self, *args, **options):
+        names = [name for name, scenario in scenarios.SCENARIOS]
+        for name in options['scenarios'] or []:
+            if name not in names:
+                raise CommandError('Unknown scenario {0}, choose from {1}'.format(name, names))
+
+        setup_test_environment()
+        old_name = settings.DATABASES[connection.alias]['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(ROOT_URLCONF='openbadges.urls'):
+                dataset = data.generate(users=options['users'],
+                                        badges=options['badges'],
+                                        awards_per_user=options['awards_per_user'],
+                                        revoked=options['revoked'],
+                                        image_size=options['image_size'])
+                results = scenarios.run(dataset, options['repeat'],
+                                        options['scenarios'])
+        finally:
+            self.delete_images()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'label': options['label'],
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'dataset': dict((key, options[key]) for key in
+                            ('users', 'badges', 'awards_per_user', 'revoked',
+                             'image_size', 'repeat')),
+            'scenarios': results,
+        }
+        if options['startup_repeat']:
+            report['startup'] = startup.run(options['startup_repeat'])
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.compare(json.load(f), report)
+
+    def delete_images(self):
+        for award in models.Award.objects.exclude(image=''):
+            award.image.delete(save=False)
+        for badge in models.Badge.objects.all():
+            badge.image.delete(save=False)
+
+    def compare(self, old, new):
+        self.stdout.write('{0:<20} {1:>12} {2:>12} {3:>8} {4:>10}'.format(
+            'scenario', 'old p50 ms', 'new p50 ms', 'ratio', 'queries'))
+        for name in sorted(new['scenarios']):
+            if name not in old['scenarios']:
+                continue
+            old_p50 = old['scenarios'][name]['latency_ms']['p50']
+            new_p50 = new['scenarios'][name]['latency_ms']['p50']
+            self.stdout.write('{0:<20} {1:>12.3f} {2:>12.3f} {3:>8.2f} {4:>4.1f}->{5:.1f}'.format(
+                name, old_p50, new_p50, new_p50 / old_p50 if old_p50 else 0,
+                old['scenarios'][name]['queries']['mean'],
+                new['scenarios'][name]['queries']['mean']))
+        for name in sorted(new.get('startup', {})):
+            if name not in old.get('startup', {}):
+                continue
+            self.stdout.write('startup {0:<12} {1:>12.3f} {2:>12.3f} {3:>8} {4}->{5} kb'.format(
+                name, old['startup'][name]['seconds'] * 1000, new['startup'][name]['seconds'] * 1000,
+                '', old['startup'][name]['max_rss_kb'], new['startup'][name]['max_rss_kb']))
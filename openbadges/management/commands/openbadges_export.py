@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from django.core.management.base import BaseCommand, CommandError
+
+from optparse import make_option
+import sys
+
+from openbadges import export
+from openbadges import models
+
+
+class Command(BaseCommand):
+    args = '<{0}>'.format('|'.join(export.KINDS))
+    help = 'Exports assertions, badge classes or revocations as JSON Lines'
+    option_list = BaseCommand.option_list + (
+        make_option('--after', help='Resume after this id'),
+        make_option('--after-uuid', dest='after_uuid',
+                    help='Resume after the assertion with this uuid'),
+        make_option('--chunk-size', type='int', default=1000, dest='chunk_size'),
+        make_option('--gzip', action='store_true', default=False),
+        make_option('--output', help='File to write, standard output by default'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1 or args[0] not in export.KINDS:
+            raise CommandError('Usage: openbadges_export {0}'.format(self.args))
+        kind = args[0]
+        try:
+            after = export.resolve_cursor(kind, options['after'], options['after_uuid'])
+        except (ValueError, models.Award.DoesNotExist) as e:
+            raise CommandError(str(e) or 'Unknown assertion uuid')
+
+        lines = export.iter_lines(kind, after, options['chunk_size'])
+        if options['gzip']:
+            stream = export.gzip_stream(lines)
+        else:
+            stream = (line.encode('utf-8') for line in lines)
+        if options['output']:
+            output = open(options['output'], 'wb')
+        else:
+            # the text stream of python 3 doesn't take bytes
+            output = getattr(sys.stdout, 'buffer', sys.stdout)
+        try:
+            for data in stream:
+                output.write(data)
+        finally:
+            if options['output']:
+                output.close()
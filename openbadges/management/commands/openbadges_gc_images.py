@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from django.core.management.base import BaseCommand
+
+from optparse import make_option
+
+from openbadges import images
+
+
+class Command(BaseCommand):
+    help = 'Deletes the badge and award image files nothing references'
+    option_list = BaseCommand.option_list + (
+        make_option('--directory', default='badges',
+                    help='Storage directory to scan'),
+        make_option('--min-age', type='int', default=3600, dest='min_age',
+                    help='Keep files modified less than these seconds ago'),
+        make_option('--chunk-size', type='int', default=1000, dest='chunk_size',
+                    help='Files checked on every query'),
+        make_option('--dry-run', action='store_true', default=False, dest='dry_run',
+                    help='List the orphan files without deleting them'),
+    )
+
+    def handle(self, *args, **options):
+        storage = images.get_storage()
+        count = 0
+        for name in images.iter_orphans(options['directory'], options['min_age'],
+                                        options['chunk_size']):
+            if not options['dry_run']:
+                storage.delete(name)
+            if int(options['verbosity']) > 1 or options['dry_run']:
+                self.stdout.write(name)
+            count += 1
+        self.stdout.write('{0} orphan files {1}'.format(
+            count, 'found' if options['dry_run'] else 'deleted'))
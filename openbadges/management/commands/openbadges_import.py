@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from django.core.management.base import BaseCommand, CommandError
+
+from multiprocessing import Pool
+from optparse import make_option
+import time
+
+from openbadges import chunks
+from openbadges import imports
+from openbadges import tasks
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = 'Awards badges from a CSV or JSON Lines file with user, badge, evidence and expires'
+    option_list = BaseCommand.option_list + (
+        make_option('--format', type='choice', choices=imports.FORMATS,
+                    help='csv or jsonl, guessed from the file extension by default'),
+        make_option('--user-field', type='choice', choices=imports.USER_FIELDS,
+                    default='id', dest='user_field',
+                    help='User field in the user column'),
+        make_option('--on-conflict', type='choice', choices=imports.CONFLICTS,
+                    default='skip', dest='on_conflict',
+                    help='Skip or update the evidence and expiration of existing awards'),
+        make_option('--chunk-size', type='int', default=5000, dest='chunk_size',
+                    help='Rows read and awarded on every chunk'),
+        make_option('--processes', type='int', default=1,
+                    help='Bake the images in this number of processes'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: openbadges_import {0}'.format(self.args))
+        path = args[0]
+        format = options['format'] or imports.guess_format(path)
+
+        pool = None
+        if options['processes'] > 1:
+            tasks.close_connections()
+            pool = Pool(options['processes'])
+        importer = imports.Importer(options['user_field'], options['on_conflict'], pool)
+        start = time.time()
+        total = 0
+        stream = imports.open_rows(path, format)
+        try:
+            rows = imports.iter_rows(stream, format)
+            for chunk in chunks.iter_chunks(rows, options['chunk_size']):
+                importer.import_chunk(chunk)
+                total += len(chunk)
+                self.stdout.write('{0} rows, {1} created, {2} updated, {3} skipped, '
+                                  '{4} invalid'.format(total, importer.created, importer.updated,
+                                                       importer.skipped, importer.invalid))
+        finally:
+            stream.close()
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        elapsed = time.time() - start
+        self.stdout.write('Imported {0} rows in {1:.2f}s ({2:.0f} rows/s)'.format(
+            total, elapsed, total / elapsed if elapsed else 0))
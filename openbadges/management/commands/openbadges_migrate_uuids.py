@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from optparse import make_option
+
+from openbadges import models
+
+
+class Command(BaseCommand):
+    help = ('Converts the award uuid column of a database created by an older '
+            'version to the native uuid type with a unique index')
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', default=False, dest='dry_run',
+                    help='Print the SQL without running it'),
+    )
+
+    def handle(self, *args, **options):
+        table = connection.ops.quote_name(models.Award._meta.db_table)
+        column = connection.ops.quote_name('uuid')
+        cursor = connection.cursor()
+        indexes = self.get_indexes(cursor)
+        if any(unique for name, unique in indexes):
+            self.stdout.write('The award uuids already have a unique index')
+            return
+
+        cursor.execute('SELECT {0} FROM {1} GROUP BY {0} HAVING COUNT(*) > 1'.format(
+            column, table))
+        duplicated = [row[0] for row in cursor.fetchall()]
+        if duplicated:
+            raise CommandError('Duplicated award uuids: {0}'.format(', '.join(duplicated)))
+        cursor.execute('SELECT {0} FROM {1}'.format(column, table))
+        invalid = []
+        rows = cursor.fetchmany(10000)
+        while rows:
+            invalid.extend(row[0] for row in rows if models.parse_uuid(row[0]) != row[0])
+            rows = cursor.fetchmany(10000)
+        if invalid:
+            raise CommandError('Award uuids not in canonical form: {0}'.format(
+                ', '.join(invalid[:20])))
+
+        statements = ['DROP INDEX {0}'.format(self.drop_target(connection.ops.quote_name(name), table))
+                      for name, unique in indexes]
+        if connection.vendor == 'postgresql':
+            statements.append('ALTER TABLE {0} ALTER COLUMN {1} TYPE uuid USING {1}::uuid'.format(
+                table, column))
+        elif connection.vendor == 'mysql':
+            statements.append('ALTER TABLE {0} MODIFY {1} char(36) NOT NULL'.format(table, column))
+        statements.append('CREATE UNIQUE INDEX {0} ON {1} ({2})'.format(
+            connection.ops.quote_name('openbadges_award_uuid_uniq'), table, column))
+
+        if options['dry_run']:
+            for statement in statements:
+                self.stdout.write(statement + ';')
+            return
+        with transaction.atomic():
+            for statement in statements:
+                cursor.execute(statement)
+        self.stdout.write('Converted the uuids of the awards')
+
+    def drop_target(self, name, table):
+        if connection.vendor == 'mysql':
+            return '{0} ON {1}'.format(name, table)
+        return name
+
+    def get_indexes(self, cursor):
+        """
+        Name and uniqueness of the indexes on the uuid column, all of them
+        replaced by the unique one
+        """
+        table = models.Award._meta.db_table
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s",
+                           [table])
+            return [(name, definition.startswith('CREATE UNIQUE'))
+                    for name, definition in cursor.fetchall()
+                    if '(uuid' in definition.replace('"', '')]
+        if connection.vendor == 'mysql':
+            cursor.execute('SHOW INDEX FROM {0} WHERE Column_name = %s'.format(
+                connection.ops.quote_name(table)), ['uuid'])
+            return sorted(set((row[2], not row[1]) for row in cursor.fetchall()))
+        if connection.vendor == 'sqlite':
+            indexes = []
+            cursor.execute('PRAGMA index_list({0})'.format(connection.ops.quote_name(table)))
+            for row in cursor.fetchall():
+                cursor.execute('PRAGMA index_info({0})'.format(connection.ops.quote_name(row[1])))
+                if [info[2] for info in cursor.fetchall()] == ['uuid']:
+                    indexes.append((row[1], bool(row[2])))
+            return indexes
+        raise CommandError('Unsupported database: {0}'.format(connection.vendor))
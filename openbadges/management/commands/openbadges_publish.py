@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from django.core.management.base import BaseCommand, CommandError
+
+from optparse import make_option
+
+from openbadges import publish
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the static OBI documents under BADGES_PUBLISH_ROOT'
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', type='int', default=1000, dest='chunk_size',
+                    help='Assertions read on every query'),
+    )
+
+    def handle(self, *args, **options):
+        if not publish.is_enabled():
+            raise CommandError('BADGES_PUBLISH_ROOT is not configured')
+        count = publish.rebuild(options['chunk_size'])
+        self.stdout.write('Published {0} assertions in {1}'.format(count, publish.get_root()))
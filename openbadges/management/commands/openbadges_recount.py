@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from django.core.management.base import BaseCommand
+
+from optparse import make_option
+
+from openbadges import counters
+
+
+class Command(BaseCommand):
+    help = 'Recounts the awarded, revoked and active awards of badges and users'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=1000, dest='batch_size',
+                    help='Identities read on every batch'),
+    )
+
+    def handle(self, *args, **options):
+        badges = counters.recount_badges()
+        identities = counters.recount_identities(options['batch_size'])
+        self.stdout.write('Fixed the counters of {0} badges and {1} identities'.format(
+            badges, identities))
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from functools import partial
+from multiprocessing import Pool
+from optparse import make_option
+
+from openbadges import identities
+from openbadges import tasks
+
+
+class Command(BaseCommand):
+    help = 'Creates the missing identities and rehashes the outdated ones'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=1000,
+                    dest='batch_size',
+                    help='Users read and written on every batch'),
+        make_option('--processes', type='int', default=1,
+                    help='Split the users between this number of processes'),
+    )
+
+    def handle(self, *args, **options):
+        bounds = get_user_model().objects.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None:
+            return
+        sync = partial(identities.sync_range, batch_size=options['batch_size'])
+
+        if options['processes'] > 1:
+            ranges = identities.split_ranges(bounds['first'], bounds['last'],
+                                             options['processes'])
+            tasks.close_connections()
+            pool = Pool(options['processes'])
+            try:
+                results = pool.map(sync, ranges)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [sync((bounds['first'], bounds['last']))]
+
+        self.stdout.write('Created {0} identities, rehashed {1}'.format(
+            sum(r[0] for r in results), sum(r[1] for r in results)))
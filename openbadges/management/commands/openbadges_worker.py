@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from django.core.management.base import BaseCommand
+
+from multiprocessing import Pool
+from optparse import make_option
+from multiprocessing.pool import ThreadPool
+import time
+
+from openbadges import tasks
+
+
+class Command(BaseCommand):
+    help = 'Bakes the images of the awards pending in the baking queue'
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', default=4,
+                    help='Number of threads (or processes) baking images'),
+        make_option('--processes', action='store_true', default=False,
+                    help='Use a process pool instead of a thread pool'),
+        make_option('--batch-size', type='int', default=100,
+                    dest='batch_size',
+                    help='Awards claimed on every iteration'),
+        make_option('--sleep', type='float', default=5,
+                    help='Seconds to wait when the queue is empty'),
+        make_option('--once', action='store_true', default=False,
+                    help='Exit when the queue is empty'),
+        make_option('--requeue', action='store_true', default=False,
+                    help='Put back awards left as processing by a dead worker'),
+    )
+
+    def handle(self, *args, **options):
+        if options['requeue']:
+            self.stdout.write('Requeued {0} awards'.format(tasks.requeue_processing()))
+
+        if options['processes']:
+            tasks.close_connections()
+            pool = Pool(options['workers'])
+        else:
+            pool = ThreadPool(options['workers'])
+
+        try:
+            while True:
+                ids = tasks.pending_ids(options['batch_size'])
+                if not ids:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                results = pool.map(tasks.process_award, ids)
+                self.stdout.write('Baked {0}, retrying {1}, failed {2}'.format(
+                    results.count('done'), results.count('pending'),
+                    results.count('failed')))
+        finally:
+            pool.close()
+            pool.join()
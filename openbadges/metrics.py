@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Optional instrumentation of the hot paths, exposed in the Prometheus text
+format by the metrics view.
+
+It is disabled unless BADGES_METRICS is True. Every process keeps its own
+registry; with BADGES_METRICS_DIR every process also dumps it to a file in
+that directory, at most every BADGES_METRICS_FLUSH_INTERVAL seconds, and the
+metrics view adds up the files of all processes.
+"""
+
+from django.conf import settings
+from django.db import connection
+
+from functools import wraps
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HELP = {
+    'openbadges_view_seconds': 'Time spent in the openbadges views',
+    'openbadges_view_queries_total': 'Database queries made by the openbadges views',
+    'openbadges_cache_requests_total': 'Lookups in the openbadges cache',
+    'openbadges_baking_seconds': 'Time spent baking award images',
+    'openbadges_revocation_lookup_seconds': 'Time spent looking up award revocations',
+    'openbadges_serialization_seconds': 'Time spent serializing OBI documents',
+    'openbadges_baking_queue_depth': 'Awards waiting in the baking queue',
+}
+
+_lock = threading.Lock()
+_types = {}
+_values = {}
+_last_flush = [0]
+
+
+def is_enabled():
+    return getattr(settings, 'BADGES_METRICS', False)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    if not is_enabled():
+        return
+    with _lock:
+        _types[name] = 'counter'
+        key = _key(name, labels)
+        _values[key] = _values.get(key, 0) + amount
+    maybe_flush()
+
+
+def observe(name, seconds, **labels):
+    if not is_enabled():
+        return
+    with _lock:
+        _types[name] = 'histogram'
+        key = _key(name, labels)
+        # one count per bucket (not cumulative), then sum and count
+        value = _values.setdefault(key, [0] * len(BUCKETS) + [0, 0])
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                value[i] += 1
+                break
+        value[-2] += seconds
+        value[-1] += 1
+    maybe_flush()
+
+
+class timer(object):
+    """
+    Context manager and decorator observing the time spent in a histogram
+    """
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.time() - self.start, **self.labels)
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            with timer(self.name, **self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class track_view(object):
+    """
+    Times a view and, when the queries are being logged, counts them
+    """
+    def __init__(self, view):
+        self.view = view
+
+    def __enter__(self):
+        self.enabled = is_enabled()
+        if self.enabled:
+            self.force_queries = getattr(settings, 'BADGES_METRICS_QUERIES', False)
+            if self.force_queries:
+                self.old_debug_cursor = connection.use_debug_cursor
+                connection.use_debug_cursor = True
+            self.queries = len(connection.queries)
+            self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.enabled:
+            return
+        observe('openbadges_view_seconds', time.time() - self.start, view=self.view)
+        if self.force_queries or settings.DEBUG:
+            inc('openbadges_view_queries_total', len(connection.queries) - self.queries,
+                view=self.view)
+        if self.force_queries:
+            connection.use_debug_cursor = self.old_debug_cursor
+
+
+def snapshot():
+    with _lock:
+        return [[name, list(labels), value] for (name, labels), value in _values.items()], dict(_types)
+
+
+def get_path(pid):
+    return os.path.join(settings.BADGES_METRICS_DIR, '{0}.json'.format(pid))
+
+
+def flush():
+    if not getattr(settings, 'BADGES_METRICS_DIR', None):
+        return
+    values, types = snapshot()
+    path = get_path(os.getpid())
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'types': types, 'values': values}, f)
+    os.rename(path + '.tmp', path)
+
+
+def maybe_flush():
+    interval = getattr(settings, 'BADGES_METRICS_FLUSH_INTERVAL', 5)
+    now = time.time()
+    if now - _last_flush[0] >= interval:
+        _last_flush[0] = now
+        flush()
+
+
+atexit.register(lambda: is_enabled() and flush())
+
+
+def collect():
+    """
+    Values of all the processes: the live registry of this one and the files
+    of the others
+    """
+    values, types = snapshot()
+    merged = {}
+    sources = [(values, types)]
+    directory = getattr(settings, 'BADGES_METRICS_DIR', None)
+    if directory:
+        own = get_path(os.getpid())
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (IOError, ValueError):
+                continue
+            sources.append((data['values'], data['types']))
+
+    for source_values, source_types in sources:
+        types.update(source_types)
+        for name, labels, value in source_values:
+            key = (name, tuple(tuple(label) for label in labels))
+            if key not in merged:
+                merged[key] = value
+            elif isinstance(value, list):
+                merged[key] = [a + b for a, b in zip(merged[key], value)]
+            else:
+                merged[key] += value
+    return merged, types
+
+
+def format_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in labels) + '}'
+
+
+def render(gauges=None):
+    """
+    Prometheus text exposition of the collected metrics, plus the gauges
+    given as {name: value}
+    """
+    merged, types = collect()
+    lines = []
+    for name in sorted(set(name for name, labels in merged)):
+        lines.append('# HELP {0} {1}'.format(name, HELP.get(name, name)))
+        lines.append('# TYPE {0} {1}'.format(name, types[name]))
+        for (metric, labels), value in sorted(merged.items()):
+            if metric != name:
+                continue
+            if types[name] == 'histogram':
+                cumulative = 0
+                for bound, count in zip(BUCKETS, value):
+                    cumulative += count
+                    lines.append('{0}_bucket{1} {2}'.format(name, format_labels(labels, [('le', bound)]), cumulative))
+                lines.append('{0}_bucket{1} {2}'.format(name, format_labels(labels, [('le', '+Inf')]), value[-1]))
+                lines.append('{0}_sum{1} {2}'.format(name, format_labels(labels), value[-2]))
+                lines.append('{0}_count{1} {2}'.format(name, format_labels(labels), value[-1]))
+            else:
+                lines.append('{0}{1} {2}'.format(name, format_labels(labels), value))
+    for name, value in sorted((gauges or {}).items()):
+        lines.append('# HELP {0} {1}'.format(name, HELP.get(name, name)))
+        lines.append('# TYPE {0} gauge'.format(name))
+        lines.append('{0} {1}'.format(name, value))
+    return '\n'.join(lines) + '\n'
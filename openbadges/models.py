@@ -20,18 +20,27 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError, ImproperlyConfigured
 from django.core.urlresolvers import reverse
-from django.core.files import File
-from django.db import models
-from django.db.models.signals import post_save
+from django.core.files.base import ContentFile
+from django.db import connection, models, transaction
+from django.db.models import F, Q
+from django.db.models.query import QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
+from django.utils import six, timezone
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ugettext
 
-import Image
-import PngImagePlugin
+import django
 import hashlib
+import json
 import uuid
-import tempfile
+
+from . import baking
+from . import cache
+from . import chunks
+from . import metrics
+from . import responses
+from . import signing
 
 
 if settings.BADGES_BASE_URL is None:
@@ -49,10 +58,90 @@ def build_absolute_url(url):
     return '%s%s' % (base_url, url)
 
 
+def make_uuid():
+    # uuid1 exposes the MAC address of the host
+    return str(uuid.uuid4())
+
+
+def parse_uuid(value):
+    """
+    The canonical form of an award uuid, or None if the value isn't one
+    """
+    try:
+        return str(uuid.UUID(value))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class UUIDField(models.CharField):
+    """
+    Uuid stored as text, in the native 16 bytes uuid type on PostgreSQL.
+    Values must be valid uuids there, so lookups take parse_uuid() values.
+    The values are always str, even if the driver returns uuid.UUID (as
+    psycopg2 does since Django 1.8).
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 36)
+        super(UUIDField, self).__init__(*args, **kwargs)
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'uuid'
+        return super(UUIDField, self).db_type(connection)
+
+    def to_python(self, value):
+        if isinstance(value, uuid.UUID):
+            return str(value)
+        return super(UUIDField, self).to_python(value)
+
+    def from_db_value(self, value, expression, connection, *args):
+        # Django >= 1.8
+        return self.to_python(value)
+
+
+if django.VERSION < (1, 8):
+    UUIDField = six.add_metaclass(models.SubfieldBase)(UUIDField)
+
+
+def counts_exposed():
+    return getattr(settings, 'BADGES_EXPOSE_COUNTS', False)
+
+
+def make_salt():
+    return uuid.uuid4().hex[:5]
+
+
+def make_identity_hash(email, salt):
+    return u'sha256$' + hashlib.sha256((email + salt).encode('utf-8')).hexdigest()
+
+
 IDENTITY_CHOICES = (
     ('email', _(u'User email')),
 )
 
+BAKING_CHOICES = (
+    ('pending', _(u'Pending')),
+    ('processing', _(u'Processing')),
+    ('done', _(u'Done')),
+    ('failed', _(u'Failed')),
+)
+
+
+VERIFICATION_CHOICES = (
+    ('hosted', _(u'Hosted')),
+    ('signed', _(u'Signed')),
+)
+
+
+def default_verification_type():
+    return signing.get_verification_type()
+
+
+def default_baking_status():
+    if getattr(settings, 'BADGES_BAKING_QUEUE', False):
+        return 'pending'
+    return 'done'
+
 
 class Identity(models.Model):
     user = models.OneToOneField(get_user_model(), verbose_name=_(u'User identity'),
@@ -63,10 +152,13 @@ class Identity(models.Model):
                             choices=IDENTITY_CHOICES,
                             default=IDENTITY_CHOICES[0][0])
     identity_hash = models.CharField(verbose_name=_(u'Identity hash'),
-                                     blank=True, null=False, max_length=255)
+                                     blank=True, null=False, max_length=255,
+                                     db_index=True)
     hashed = models.BooleanField(verbose_name=_(u'Hashed'), default=True)
     salt = models.CharField(verbose_name=_(u'Identity salt'), blank=True,
                             null=True, max_length=255)
+    active_count = models.IntegerField(verbose_name=_(u'Active awards'),
+                                       default=0, editable=False)
 
     class Meta:
         verbose_name = _(u'identity')
@@ -84,6 +176,15 @@ class Identity(models.Model):
         }
 
 
+class BadgeManager(models.Manager):
+    def with_related(self):
+        """
+        Badges with their alignments and tags prefetched, for serializing
+        many of them without two queries per badge
+        """
+        return self.prefetch_related('alignments', 'tags')
+
+
 class Badge(models.Model):
     title = models.CharField(verbose_name=_(u'Name'), blank=False, null=False,
                              unique=True, max_length=255,
@@ -111,6 +212,14 @@ class Badge(models.Model):
                                    auto_now_add=True, blank=False)
     modified = models.DateTimeField(verbose_name=_(u'Last modification date and time'),
                                     auto_now=True, blank=False)
+    awarded_count = models.IntegerField(verbose_name=_(u'Awarded'), default=0,
+                                        editable=False)
+    revoked_count = models.IntegerField(verbose_name=_(u'Revoked'), default=0,
+                                        editable=False)
+    active_count = models.IntegerField(verbose_name=_(u'Active'), default=0,
+                                       editable=False)
+
+    objects = BadgeManager()
 
     class Meta:
         ordering = ['-modified', '-created']
@@ -123,8 +232,26 @@ class Badge(models.Model):
     def get_absolute_url(self):
         return build_absolute_url(reverse('badge', args=[self.slug]))
 
+    def to_document(self):
+        """
+        Serialized BadgeClass with its validators, cached by slug until the
+        badge, its alignments, its tags or the issuer change. The etag is
+        the hash of the body, so every process gives the same one, and the
+        receivers below keep Badge.modified as the Last-Modified of all of it.
+        """
+        body = json.dumps(self.to_dict())
+        document = {
+            'status': 200,
+            'body': body,
+            'etag': responses.make_etag(body),
+            'last_modified': responses.to_timestamp(self.modified),
+        }
+        cache.set_entry('badges', self.slug, document)
+        return document
+
+    @metrics.timer('openbadges_serialization_seconds', document='badge')
     def to_dict(self):
-        return {
+        data = {
             'name': self.title,
             'description': self.description,
             'image': build_absolute_url(self.image.url),
@@ -133,16 +260,174 @@ class Badge(models.Model):
             'alignment': [a.to_dict() for a in self.alignments.all()],
             'tags': [t.name for t in self.tags.all()]
         }
+        if counts_exposed():
+            data['extensions:awardCounts'] = {
+                'awarded': self.awarded_count,
+                'revoked': self.revoked_count,
+                'active': self.active_count,
+            }
+        return data
+
+
+class AwardQuerySet(QuerySet):
+    def with_status(self):
+        """
+        Annotates is_revoked with an EXISTS subquery, so Award.revoked
+        doesn't need a query per award
+        """
+        qn = connection.ops.quote_name
+        return self.extra(select={
+            'is_revoked': 'EXISTS (SELECT 1 FROM {0} WHERE {0}.{1} = {2}.{3})'.format(
+                qn(Revocation._meta.db_table), qn('award_id'),
+                qn(self.model._meta.db_table), qn(self.model._meta.pk.column))
+        })
+
+    def for_badge_and_user(self, badge_slug, user_key, mode):
+        """
+        Award of a badge by slug to a user by id or, with mode 'email', by
+        email, resolved with one joined query
+        """
+        if mode == 'email':
+            return self.filter(badge__slug=badge_slug, user__email=user_key)
+        return self.filter(badge__slug=badge_slug, user=user_key)
+
+    def for_recipient(self, email=None, identity_hash=None):
+        """
+        Awards issued to a hashed identity or to an email. The email is
+        hashed with the salts on record for its users, so both are looked up
+        in the identity_hash index.
+
+        The users of the email are resolved first with a single query on the
+        user email column, which isn't indexed by Django: see the README.
+        """
+        if identity_hash is not None:
+            return self.filter(identity_hash=identity_hash)
+        user_pks = list(get_user_model().objects.filter(email=email)
+                                        .values_list('pk', flat=True))
+        salts = set()
+        if user_pks:
+            salts.update(Identity.objects.filter(user__in=user_pks)
+                                         .values_list('salt', flat=True))
+            salts.update(Award.objects.filter(user__in=user_pks).order_by()
+                                      .values_list('identity_salt', flat=True).distinct())
+        # unhashed identities keep the email itself
+        candidates = [email] + [make_identity_hash(email, salt or u'') for salt in salts]
+        return self.filter(identity_hash__in=candidates)
+
+    def revoked(self):
+        return self.filter(pk__in=Revocation.objects.values('award'))
+
+    def not_revoked(self):
+        return self.exclude(pk__in=Revocation.objects.values('award'))
+
+    def expired(self):
+        return self.filter(expires__lt=timezone.now())
+
+    def not_expired(self):
+        return self.filter(Q(expires__isnull=True) | Q(expires__gte=timezone.now()))
+
+
+class AwardManager(models.Manager):
+    def get_queryset(self):
+        return AwardQuerySet(self.model, using=self._db)
+
+    def with_status(self):
+        return self.get_queryset().with_status()
+
+    def for_badge_and_user(self, badge_slug, user_key, mode):
+        return self.get_queryset().for_badge_and_user(badge_slug, user_key, mode)
+
+    def for_recipient(self, email=None, identity_hash=None):
+        return self.get_queryset().for_recipient(email, identity_hash)
+
+    def bulk_award(self, badge, users, evidence=None, expires=None,
+                   batch_size=500, pool=None):
+        """
+        Awards the badge to many users at once, without the post_save
+        cascade of saving them one by one.
+
+        Identities are copied with one query per batch, awards are inserted
+        with bulk_create and the images are baked afterwards, so the result
+        is the same that the post_save handlers produce. Users who already
+        have the badge are skipped. Returns the list of created awards.
+
+        evidence and expires can also be dicts by user pk. The images are
+        baked in the multiprocessing pool, if given.
+        """
+        user_ids = [getattr(user, 'pk', user) for user in users]
+        created = []
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            with transaction.atomic():
+                created.extend(self._award_batch(badge, batch, evidence,
+                                                 expires, pool))
+        return created
+
+    def _award_batch(self, badge, user_ids, evidence, expires, pool):
+        awarded = set(self.filter(badge=badge, user__in=user_ids)
+                          .values_list('user_id', flat=True))
+        user_ids = [pk for pk in user_ids if pk not in awarded]
+        identities = dict((identity.user_id, identity) for identity in
+                          Identity.objects.filter(user__in=user_ids))
+        missing = [pk for pk in user_ids if pk not in identities]
+        if missing:
+            raise Identity.DoesNotExist(
+                'Users without identity: {0}'.format(missing))
+
+        awards = []
+        for user_id in user_ids:
+            award = self.model(user_id=user_id, badge=badge,
+                               evidence=by_user(evidence, user_id),
+                               expires=by_user(expires, user_id))
+            copy_identity_to_award(award, identities[user_id])
+            awards.append(award)
+        self.bulk_create(awards)
+
+        # bulk_create doesn't set primary keys, so fetch them back
+        awards = list(self.filter(badge=badge, user__in=user_ids))
+        for award in awards:
+            award.badge = badge
+            # new awards aren't revoked
+            award.is_revoked = False
+            cache.bump_version('user:{0}'.format(award.user_id))
+        if awards:
+            update_counts(badge.pk, [award.user_id for award in awards],
+                          awarded=len(awards), active=len(awards))
+        # with the queue they are left as pending for the openbadges_worker command
+        if not getattr(settings, 'BADGES_BAKING_QUEUE', False):
+            self._bake_batch(awards, pool)
+        if publish.is_enabled():
+            for award in awards:
+                publish.publish_assertion(award)
+        return awards
+
+    def _bake_batch(self, awards, pool):
+        if pool is None:
+            for award in awards:
+                bake_award_image(award)
+        else:
+            # signed assertions are serialized here and signed in the pool
+            names = pool.map(bake_image_file, [(award.badge, get_bake_payload(award))
+                                               for award in awards])
+            for award, name in zip(awards, names):
+                award.image = name
+        for award in awards:
+            self.filter(pk=award.pk).update(image=award.image.name)
+
+
+def by_user(value, user_id):
+    if isinstance(value, dict):
+        return value.get(user_id)
+    return value
 
 
 class Award(models.Model):
     """
-    Only available verification type 'hosted' by design decision.
-    If 'signed' type is needed, it's necessary to add
-    corresponding fields and methods, and refactor in to_dict()
+    The verification type is taken from BADGES_VERIFICATION when the award
+    is created. Signed awards bake a JWS of the assertion in the image
+    instead of its url.
     """
-    uuid = models.CharField(verbose_name=_(u'Award uuid'), db_index=True,
-                            max_length=255, default=lambda: str(uuid.uuid1()))
+    uuid = UUIDField(verbose_name=_(u'Award uuid'), unique=True, default=make_uuid)
     user = models.ForeignKey(get_user_model(), verbose_name=_(u'Awardee'), blank=False,
                              null=False, related_name='user_awards')
     badge = models.ForeignKey('Badge', verbose_name=_(u'Badge'), blank=False,
@@ -156,7 +441,7 @@ class Award(models.Model):
                               validators=[validate_png_image],
                               help_text=_("Image evidence, it must be png"))
     expires = models.DateTimeField(verbose_name=_(u'When a badge should no longer be considered valid'),
-                                   blank=True, null=True)
+                                   blank=True, null=True, db_index=True)
     modified = models.DateTimeField(verbose_name=_(u'Last modification date and time'),
                                     blank=False, null=False, auto_now=True)
     identity_type = models.CharField(verbose_name=_(u'Identity type'),
@@ -164,11 +449,26 @@ class Award(models.Model):
                                      choices=IDENTITY_CHOICES,
                                      default=IDENTITY_CHOICES[0][0])
     identity_hash = models.CharField(verbose_name=_(u'Identity hash'),
-                                     blank=True, null=False, max_length=255)
+                                     blank=True, null=False, max_length=255,
+                                     db_index=True)
     identity_hashed = models.BooleanField(verbose_name=_(u'Hashed'),
                                           default=True)
     identity_salt = models.CharField(verbose_name=_(u'Identity salt'),
                                      blank=True, null=True, max_length=255)
+    verification_type = models.CharField(verbose_name=_(u'Verification type'),
+                                         blank=False, null=False, max_length=20,
+                                         choices=VERIFICATION_CHOICES,
+                                         default=default_verification_type)
+    baking_status = models.CharField(verbose_name=_(u'Image baking status'),
+                                     blank=False, null=False, max_length=20,
+                                     choices=BAKING_CHOICES, db_index=True,
+                                     default=default_baking_status, editable=False)
+    baking_attempts = models.PositiveIntegerField(verbose_name=_(u'Image baking attempts'),
+                                                  default=0, editable=False)
+    baking_error = models.TextField(verbose_name=_(u'Last image baking error'),
+                                    blank=True, null=True, editable=False)
+
+    objects = AwardManager()
 
     class Meta:
         unique_together = ('user', 'badge')
@@ -181,11 +481,14 @@ class Award(models.Model):
 
     @property
     def revoked(self):
-        try:
-            Revocation.objects.get(award=self)
-            return True
-        except Revocation.DoesNotExist:
-            return False
+        if hasattr(self, 'is_revoked'):
+            return bool(self.is_revoked)
+        with metrics.timer('openbadges_revocation_lookup_seconds'):
+            return self.revocations.exists()
+
+    @property
+    def expired(self):
+        return self.expires is not None and self.expires < timezone.now()
 
     def get_image_url(self):
         return self.badge.image.url
@@ -196,6 +499,72 @@ class Award(models.Model):
     def get_absolute_url(self):
         return build_absolute_url(reverse('assertion', args=[self.uuid]))
 
+    def get_validators(self):
+        """
+        ETag and Last-Modified of the hosted assertion. Revocations update
+        Award.modified, and the assertion links to the badge by its slug.
+        """
+        last_modified = max(responses.to_timestamp(self.modified),
+                            responses.to_timestamp(self.badge.modified))
+        etag = responses.make_etag(self.uuid, last_modified, self.revoked)
+        return etag, last_modified
+
+    def to_document(self):
+        """
+        Status code, body and validators of the hosted assertion. They are
+        cached by uuid until the award, its badge or its revocations change.
+        """
+        etag, last_modified = self.get_validators()
+        if self.revoked:
+            status, body = 410, json.dumps({'revoked': True})
+        else:
+            status, body = 200, json.dumps(self.to_dict())
+        document = {
+            'status': status,
+            'body': body,
+            'etag': etag,
+            'last_modified': last_modified,
+        }
+        cache.set_entry('assertions', self.uuid, document)
+        return document
+
+    def to_summary_dict(self):
+        """
+        What the user badges page shows of the award. It needs the badge
+        and the user already loaded.
+        """
+        return {
+            'uuid': self.uuid,
+            'title': self.badge.title,
+            'description': self.badge.description,
+            'slug': self.badge.slug,
+            'image': self.get_image_url(),
+            'public_image': self.get_image_public_url(),
+            'assertion': self.get_absolute_url(),
+            'awarded': self.awarded.strftime('%Y-%m-%d'),
+            'revoked': self.revoked,
+        }
+
+    def has_recipient(self, email):
+        """
+        True if the assertion was issued to the email
+        """
+        if not self.identity_hashed:
+            return self.identity_hash == email
+        return self.identity_hash == make_identity_hash(email, self.identity_salt or u'')
+
+    def get_verify_dict(self):
+        if self.verification_type == 'signed':
+            return {
+                'type': 'signed',
+                'url': build_absolute_url(reverse('public_key'))
+            }
+        return {
+            'type': 'hosted',
+            'url': self.get_absolute_url()
+        }
+
+    @metrics.timer('openbadges_serialization_seconds', document='assertion')
     def to_dict(self):
         return {
             'uid': self.uuid,
@@ -206,10 +575,7 @@ class Award(models.Model):
                 'salt': self.identity_salt
             },
             'badge': self.badge.get_absolute_url(),
-            'verify': {
-                'type': 'hosted',
-                'url': self.get_absolute_url()
-            },
+            'verify': self.get_verify_dict(),
             'issuedOn': self.awarded.strftime('%Y-%m-%d'),
             'image': self.image and build_absolute_url(self.image.url) or '',
             'evidence': self.evidence,
@@ -238,6 +604,7 @@ class Issuer(models.Model):
     def __unicode__(self):
         return ugettext(u'Info about issuer')
 
+    @metrics.timer('openbadges_serialization_seconds', document='issuer')
     def to_dict(self):
         return {
             'name': self.name,
@@ -248,11 +615,45 @@ class Issuer(models.Model):
         }
 
 
+class RevocationManager(models.Manager):
+    def iter_list(self, since=0, until=None, chunk_size=1000):
+        """
+        Yields (id, award uuid, reason) of the revocations with id in
+        (since, until], reading them in chunks by primary key so memory
+        doesn't grow with the size of the list
+        """
+        queryset = self.values_list('pk', 'award__uuid', 'reason')
+        if until is not None:
+            queryset = queryset.filter(pk__lte=until)
+        for page in chunks.iter_pages(queryset, since, chunk_size):
+            for row in page:
+                yield row
+
+    def iter_json(self, since=0, until=None):
+        """
+        Body of the revocation list, a JSON list of {uuid: reason}, in chunks
+        """
+        yield '['
+        separator = ''
+        for pk, uuid, reason in self.iter_list(since, until):
+            yield separator + json.dumps({uuid: reason})
+            separator = ', '
+        yield ']'
+
+
 class Revocation(models.Model):
     award = models.ForeignKey('Award', verbose_name=_(u'Award'), blank=False,
                               null=False, related_name='revocations')
     reason = models.CharField(verbose_name=_(u'Reason for revocation'),
                               blank=False, null=False, max_length=255)
+    created = models.DateTimeField(verbose_name=_(u'Revocation date and time'),
+                                   auto_now_add=True, blank=False, null=True,
+                                   db_index=True)
+    modified = models.DateTimeField(verbose_name=_(u'Last modification date and time'),
+                                    auto_now=True, blank=False, null=True,
+                                    db_index=True)
+
+    objects = RevocationManager()
 
     class Meta:
         verbose_name = _(u'revocation list')
@@ -322,53 +723,295 @@ class Criterion(models.Model):
         return build_absolute_url(reverse('criterion', args=[self.slug]))
 
 
-@receiver(post_save, sender=Award, dispatch_uid="award_post_save_obi")
-def generate_obi_badge(sender, instance, created, **kwargs):
-    if created:
-        im = Image.open(instance.badge.image)
-        meta = PngImagePlugin.PngInfo()
-        meta.add_text('openbadges', instance.get_absolute_url(), 0)
+@metrics.timer('openbadges_baking_seconds')
+def bake_award_image(award):
+    """
+    Inserts the assertion url into a copy of the badge image and stores
+    it in award.image, without saving the award
+    """
+    content = baking.bake_badge(award.badge, get_bake_text(get_bake_payload(award)))
+    award.image = store_baked_image(content)
+
+
+def get_baked_image_name(content):
+    """
+    Baked images are named by the sha1 of their content, under two levels
+    of directories so none of them holds too many files
+    """
+    digest = hashlib.sha1(content).hexdigest()
+    return '/'.join((getattr(settings, 'BADGES_BAKED_IMAGES_DIR', 'badges/baked'),
+                     digest[:2], digest[2:4], digest + '.png'))
+
+
+def store_baked_image(content):
+    """
+    Saves the baked image unless it's already stored. Returns its name.
+    """
+    storage = Award._meta.get_field('image').storage
+    name = get_baked_image_name(content)
+    if not storage.exists(name):
+        name = storage.save(name, ContentFile(content))
+    return name
+
+
+def get_bake_payload(award):
+    """
+    The assertion to sign for signed awards, its url for hosted ones
+    """
+    if award.verification_type == 'signed':
+        payload = award.to_dict()
+        # the image is the one being baked, it has no url yet
+        del payload['image']
+        return payload
+    return award.get_absolute_url()
+
+
+def get_bake_text(payload):
+    if isinstance(payload, dict):
+        return signing.sign(payload)
+    return payload
+
+
+def bake_image_file(args):
+    """
+    Bakes and stores an award image in a pool worker, returning its name
+    """
+    badge, payload = args
+    with metrics.timer('openbadges_baking_seconds'):
+        return store_baked_image(baking.bake_badge(badge, get_bake_text(payload)))
 
-        with tempfile.NamedTemporaryFile() as tmpfile:
-            im.save(tmpfile, "PNG", pnginfo=meta)
-            tmpfile.seek(0)
-            instance.image.save(str.replace(str(instance.badge.image.name), '.png', '_assertion.png'), File(tmpfile), save=False)
-            instance.save()
+
+def update_counts(badge_pk, user_pks, awarded=0, revoked=0, active=0):
+    """
+    Adds to the award counters of the badge, and to the active awards of
+    the users the active value once per user
+    """
+    Badge.objects.filter(pk=badge_pk).update(
+        awarded_count=F('awarded_count') + awarded,
+        revoked_count=F('revoked_count') + revoked,
+        active_count=F('active_count') + active)
+    if active:
+        Identity.objects.filter(user__in=user_pks).update(
+            active_count=F('active_count') + (1 if active > 0 else -1))
+    counts_changed(badge_pk)
+
+
+def recount_counts(badge_pk, user_pk):
+    """
+    Sets the revoked and active counters of the badge, and the active awards
+    of the user, to their real values. Unlike update_counts it can run more
+    than once for the same change
+    """
+    revoked = Award.objects.filter(badge=badge_pk).revoked().count()
+    Badge.objects.filter(pk=badge_pk).update(
+        revoked_count=revoked, active_count=F('awarded_count') - revoked)
+    Identity.objects.filter(user=user_pk).update(
+        active_count=Award.objects.filter(user=user_pk).not_revoked().count())
+    counts_changed(badge_pk)
+
+
+def counts_changed(badge_pk):
+    if counts_exposed():
+        # the counters are part of the BadgeClass
+        Badge.objects.filter(pk=badge_pk).update(modified=timezone.now())
+        slug = Badge.objects.filter(pk=badge_pk).values_list('slug', flat=True).first()
+        if slug is not None:
+            cache.delete_entry('badges', slug)
+            if publish.is_enabled():
+                publish.publish_badge(Badge.objects.with_related().get(pk=badge_pk))
+
+
+def copy_identity_to_award(award, identity):
+    award.identity_hash = identity.identity_hash
+    award.identity_type = identity.type
+    award.identity_hashed = identity.hashed
+    award.identity_salt = identity.salt
 
 
 @receiver(post_save, sender=Award, dispatch_uid="award_post_save_identity")
 def save_identity_for_user(sender, instance, created, **kwargs):
     """
     Handler for copying current identity into award,
-    for future consistency
+    for future consistency. Registered before generate_obi_badge, as
+    signed awards bake the recipient.
     """
     if created:
-        instance.identity_hash = instance.user.identity.identity_hash
-        instance.identity_type = instance.user.identity.type
-        instance.identity_hashed = instance.user.identity.hashed
-        instance.identity_salt = instance.user.identity.salt
-        instance.save()
+        copy_identity_to_award(instance, instance.user.identity)
+        Award.objects.filter(pk=instance.pk).update(
+            identity_hash=instance.identity_hash,
+            identity_type=instance.identity_type,
+            identity_hashed=instance.identity_hashed,
+            identity_salt=instance.identity_salt)
+
+
+@receiver(post_save, sender=Award, dispatch_uid="award_post_save_obi")
+def generate_obi_badge(sender, instance, created, **kwargs):
+    """
+    With BADGES_BAKING_QUEUE the award is left as pending and baked later
+    by the openbadges_worker command
+    """
+    if created and instance.baking_status == 'done':
+        bake_award_image(instance)
+        # update() instead of save() so post_save isn't fired again
+        Award.objects.filter(pk=instance.pk).update(image=instance.image.name)
 
 
 @receiver(post_save, sender=get_user_model(), dispatch_uid="user_post_save")
-def create_identity_for_user(sender, instance, created, **kwargs):
+def create_identity_for_user(sender, instance, created, update_fields=None, **kwargs):
     """
     Handler for create an identity on new users.
     If email changes, identity_hash must change also
     """
+    if update_fields is not None and 'email' not in update_fields:
+        # e.g. the last_login update on every login
+        return
     try:
-        instance.identity
-        current_identity_hash = instance.identity.identity_hash
-        new_candidate_identity_hash = u'sha256$' + hashlib.sha256(instance.email + instance.identity.salt).hexdigest()
-        if current_identity_hash != new_candidate_identity_hash:
-            salt = uuid.uuid4().hex[:5]
-            instance.identity.salt = salt
-            instance.identity.identity_hash = u'sha256$' + hashlib.sha256(instance.email + salt).hexdigest()
-            instance.identity.save()
-    except:
-        salt = uuid.uuid4().hex[:5]
+        identity = instance.identity
+    except Identity.DoesNotExist:
+        salt = make_salt()
         Identity.objects.create(
             user=instance,
-            identity_hash=u'sha256$' + hashlib.sha256(instance.email + salt).hexdigest(),
+            identity_hash=make_identity_hash(instance.email, salt),
             salt=salt
         )
+        return
+
+    if identity.salt is None or identity.identity_hash != make_identity_hash(instance.email, identity.salt):
+        identity.salt = make_salt()
+        identity.identity_hash = make_identity_hash(instance.email, identity.salt)
+        identity.save()
+        invalidate_user_cache(instance.pk)
+
+
+def invalidate_user_cache(user_pk):
+    # the email is part of the user badges and image urls
+    cache.bump_version('user:{0}'.format(user_pk))
+    cache.badge_images.clear()
+
+
+@receiver(post_save, sender=Award, dispatch_uid="award_post_save_cache")
+@receiver(post_delete, sender=Award, dispatch_uid="award_post_delete_cache")
+def invalidate_award_cache(sender, instance, **kwargs):
+    cache.delete_entry('assertions', instance.uuid)
+    cache.bump_version('user:{0}'.format(instance.user_id))
+    cache.badge_images.clear()
+
+
+@receiver(post_save, sender=Award, dispatch_uid="award_post_save_counts")
+def count_award(sender, instance, created, **kwargs):
+    if created:
+        update_counts(instance.badge_id, [instance.user_id], awarded=1, active=1)
+
+
+@receiver(post_delete, sender=Award, dispatch_uid="award_post_delete_counts")
+def uncount_award(sender, instance, **kwargs):
+    # its revocations were deleted and uncounted before
+    update_counts(instance.badge_id, [instance.user_id], awarded=-1, active=-1)
+
+
+@receiver(post_save, sender=Revocation, dispatch_uid="revocation_post_save_counts")
+def count_revocation(sender, instance, created, **kwargs):
+    # only the first revocation of the award changes the counters
+    if created and Revocation.objects.filter(award=instance.award_id).count() == 1:
+        award = Award.objects.filter(pk=instance.award_id).values('badge', 'user').get()
+        update_counts(award['badge'], [award['user']], revoked=1, active=-1)
+
+
+@receiver(post_delete, sender=Revocation, dispatch_uid="revocation_post_delete_counts")
+def uncount_revocation(sender, instance, **kwargs):
+    # the revocations deleted together are all gone before the first signal,
+    # so every one of them sees the award unrevoked: recount instead of
+    # applying the change once per revocation
+    if not Revocation.objects.filter(award=instance.award_id).exists():
+        award = Award.objects.filter(pk=instance.award_id).values('badge', 'user').first()
+        if award is not None:
+            recount_counts(award['badge'], award['user'])
+
+
+@receiver(post_delete, sender=Revocation, dispatch_uid="revocation_post_delete_modified")
+def date_revocation_delete(sender, instance, **kwargs):
+    """
+    A deleted revocation leaves no row to date the change of the list, so
+    the last one left takes its date
+    """
+    last = Revocation.objects.order_by('-pk').values_list('pk', flat=True).first()
+    if last is not None:
+        Revocation.objects.filter(pk=last).update(modified=timezone.now())
+
+
+@receiver(post_save, sender=Revocation, dispatch_uid="revocation_post_save_cache")
+@receiver(post_delete, sender=Revocation, dispatch_uid="revocation_post_delete_cache")
+def invalidate_revocation_cache(sender, instance, **kwargs):
+    # a revocation changes the assertion, and so its Last-Modified
+    Award.objects.filter(pk=instance.award_id).update(modified=timezone.now())
+    cache.delete_entry('assertions', instance.award.uuid)
+    cache.bump_version('user:{0}'.format(instance.award.user_id))
+    cache.badge_images.clear()
+
+
+def touch_badges(queryset):
+    # update() doesn't fire post_save, the receivers below invalidate the cache
+    queryset.update(modified=timezone.now())
+
+
+@receiver(post_save, sender=Alignment, dispatch_uid="alignment_post_save_modified")
+@receiver(pre_delete, sender=Alignment, dispatch_uid="alignment_pre_delete_modified")
+def touch_alignment_badges(sender, instance, **kwargs):
+    # before the delete, while the badges are still linked
+    touch_badges(Badge.objects.filter(alignments=instance))
+
+
+@receiver(post_save, sender=Tag, dispatch_uid="tag_post_save_modified")
+@receiver(pre_delete, sender=Tag, dispatch_uid="tag_pre_delete_modified")
+def touch_tag_badges(sender, instance, **kwargs):
+    touch_badges(Badge.objects.filter(tags=instance))
+
+
+@receiver(m2m_changed, sender=Badge.alignments.through, dispatch_uid="badge_alignments_changed_modified")
+@receiver(m2m_changed, sender=Badge.tags.through, dispatch_uid="badge_tags_changed_modified")
+def touch_changed_badges(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Badges whose alignments or tags were added or removed, from either side
+    of the relation. A clear from the alignment or tag side has no pk_set,
+    so its badges are read before it.
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            touch_badges(Badge.objects.filter(pk=instance.pk))
+    elif action in ('post_add', 'post_remove'):
+        touch_badges(Badge.objects.filter(pk__in=pk_set))
+    elif action == 'pre_clear':
+        field = 'tags' if sender is Badge.tags.through else 'alignments'
+        touch_badges(Badge.objects.filter(**{field: instance}))
+
+
+@receiver(post_save, sender=Badge, dispatch_uid="badge_post_save_cache")
+@receiver(post_delete, sender=Badge, dispatch_uid="badge_post_delete_cache")
+def invalidate_badge_cache(sender, instance, **kwargs):
+    # assertions link to the badge by its slug
+    cache.bump_version('assertions')
+    cache.bump_version('badges')
+    cache.bump_version('badge_images')
+    cache.badge_images.clear()
+
+
+@receiver(post_save, sender=Alignment, dispatch_uid="alignment_post_save_cache")
+@receiver(post_delete, sender=Alignment, dispatch_uid="alignment_post_delete_cache")
+@receiver(post_save, sender=Tag, dispatch_uid="tag_post_save_cache")
+@receiver(post_delete, sender=Tag, dispatch_uid="tag_post_delete_cache")
+@receiver(post_save, sender=Issuer, dispatch_uid="issuer_post_save_badge_cache")
+@receiver(post_delete, sender=Issuer, dispatch_uid="issuer_post_delete_badge_cache")
+@receiver(m2m_changed, sender=Badge.alignments.through, dispatch_uid="badge_alignments_changed_cache")
+@receiver(m2m_changed, sender=Badge.tags.through, dispatch_uid="badge_tags_changed_cache")
+def invalidate_badge_related_cache(sender, **kwargs):
+    cache.bump_version('badges')
+
+
+@receiver(post_save, sender=Issuer, dispatch_uid="issuer_post_save_cache")
+@receiver(post_delete, sender=Issuer, dispatch_uid="issuer_post_delete_cache")
+def invalidate_issuer_cache(sender, **kwargs):
+    cache.bump_version('issuer')
+
+
+# the publishing receivers need the models above
+from . import publish  # NOQA
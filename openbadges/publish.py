@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Static publishing of the hosted OBI documents.
+
+With BADGES_PUBLISH_ROOT the assertion, badge class, issuer and revocation
+list documents are also written to files under that directory, following
+the url layout of urls.py (``assertion/<uuid>/index.json``), so a web server
+can answer the verification requests without Python. The signal handlers
+keep the files current and the openbadges_publish command rebuilds them.
+
+Assertions published in a transaction that is rolled back stay on disk until
+the next rebuild.
+"""
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db.models.signals import (post_save, post_delete, pre_delete, pre_save,
+                                      m2m_changed)
+from django.dispatch import receiver
+
+import json
+import os
+import shutil
+import tempfile
+
+from . import chunks
+from . import signing
+from .models import Alignment, Award, Badge, Issuer, Revocation, Tag
+
+INDEX = 'index.json'
+
+
+def get_root():
+    return getattr(settings, 'BADGES_PUBLISH_ROOT', None)
+
+
+def is_enabled():
+    return bool(get_root())
+
+
+def get_path(root, url_name, args=None, filename=INDEX):
+    url = reverse(url_name, args=args)
+    return os.path.join(root, *(url.strip('/').split('/') + [filename]))
+
+
+def write_file(path, chunks):
+    """
+    Writes the file through a temporary one, so it's replaced atomically
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # created by other process
+            if not os.path.isdir(directory):
+                raise
+    fd, temp = tempfile.mkstemp(dir=directory, prefix='.publish')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk.encode('utf-8'))
+        os.chmod(temp, 0o644)
+        os.rename(temp, path)
+    except Exception:
+        os.remove(temp)
+        raise
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass
+
+
+def publish_assertion(award, root=None):
+    """
+    Revoked assertions are removed, so they fall back to the 410 of the view
+    """
+    root = root or get_root()
+    path = get_path(root, 'assertion', [award.uuid])
+    if award.revoked:
+        remove_file(path)
+    else:
+        write_file(path, [json.dumps(award.to_dict())])
+
+
+def remove_assertion(award_uuid):
+    remove_file(get_path(get_root(), 'assertion', [award_uuid]))
+
+
+def publish_badge(badge, root=None):
+    write_file(get_path(root or get_root(), 'badge', [badge.slug]),
+               [json.dumps(badge.to_dict())])
+
+
+def remove_badge(slug):
+    remove_file(get_path(get_root(), 'badge', [slug]))
+
+
+def publish_issuer(root=None):
+    root = root or get_root()
+    issuer = Issuer.objects.all()[:1]
+    if issuer:
+        write_file(get_path(root, 'issuer'), [json.dumps(issuer[0].to_dict())])
+    else:
+        remove_file(get_path(root, 'issuer'))
+
+
+def publish_revocation_list(root=None):
+    """
+    The same body of the revocation list view without cursor
+    """
+    write_file(get_path(root or get_root(), 'revocation_list'),
+               Revocation.objects.iter_json())
+
+
+def publish_public_key(root=None):
+    if getattr(settings, 'BADGES_SIGNING_KEY', None):
+        write_file(get_path(root or get_root(), 'public_key', filename='index.pem'),
+                   [signing.get_public_key_pem().decode('ascii')])
+
+
+def publish_badge_awards(badge, root=None, chunk_size=1000):
+    """
+    Publishes the assertions of the badge, reading them in chunks
+    """
+    awards = Award.objects.with_status().select_related('badge').filter(badge=badge)
+    count = 0
+    for page in chunks.iter_pages(awards, chunk_size=chunk_size):
+        for award in page:
+            publish_assertion(award, root)
+        count += len(page)
+    return count
+
+
+def publish_all(root, chunk_size=1000):
+    """
+    Publishes every document under root. Returns the number of assertions.
+    """
+    publish_issuer(root)
+    publish_revocation_list(root)
+    publish_public_key(root)
+    count = 0
+    for badge in Badge.objects.with_related():
+        publish_badge(badge, root)
+        count += publish_badge_awards(badge, root, chunk_size)
+    return count
+
+
+def rebuild(chunk_size=1000):
+    """
+    Publishes everything in a new directory and swaps it with the current
+    one, so files of deleted documents don't survive the rebuild
+    """
+    root = os.path.abspath(get_root())
+    new = root + '.new'
+    old = root + '.old'
+    shutil.rmtree(new, ignore_errors=True)
+    count = publish_all(new, chunk_size)
+    if os.path.isdir(root):
+        shutil.rmtree(old, ignore_errors=True)
+        os.rename(root, old)
+    os.rename(new, root)
+    shutil.rmtree(old, ignore_errors=True)
+    return count
+
+
+@receiver(post_save, sender=Award, dispatch_uid="award_post_save_publish")
+def publish_award(sender, instance, **kwargs):
+    if is_enabled():
+        publish_assertion(instance)
+
+
+@receiver(post_delete, sender=Award, dispatch_uid="award_post_delete_publish")
+def unpublish_award(sender, instance, **kwargs):
+    if is_enabled():
+        remove_assertion(instance.uuid)
+
+
+@receiver(post_save, sender=Revocation, dispatch_uid="revocation_post_save_publish")
+@receiver(post_delete, sender=Revocation, dispatch_uid="revocation_post_delete_publish")
+def publish_revocation(sender, instance, **kwargs):
+    if is_enabled():
+        award = (Award.objects.with_status().select_related('badge')
+                              .filter(pk=instance.award_id).first())
+        if award is not None:
+            publish_assertion(award)
+        publish_revocation_list()
+
+
+@receiver(pre_save, sender=Badge, dispatch_uid="badge_pre_save_publish")
+def remember_badge_slug(sender, instance, **kwargs):
+    if is_enabled() and instance.pk:
+        instance._published_slug = (Badge.objects.filter(pk=instance.pk)
+                                                 .values_list('slug', flat=True).first())
+
+
+@receiver(post_save, sender=Badge, dispatch_uid="badge_post_save_publish")
+def publish_badge_class(sender, instance, **kwargs):
+    if not is_enabled():
+        return
+    publish_badge(instance)
+    old_slug = getattr(instance, '_published_slug', None)
+    if old_slug and old_slug != instance.slug:
+        # the assertions link to the badge by its slug
+        remove_badge(old_slug)
+        publish_badge_awards(instance)
+
+
+@receiver(post_delete, sender=Badge, dispatch_uid="badge_post_delete_publish")
+def unpublish_badge_class(sender, instance, **kwargs):
+    if is_enabled():
+        remove_badge(instance.slug)
+
+
+def publish_badges(pks):
+    for badge in Badge.objects.with_related().filter(pk__in=list(pks)):
+        publish_badge(badge)
+
+
+def get_related_badges(instance):
+    """
+    Pks of the badges of an alignment or a tag
+    """
+    field = 'tags' if isinstance(instance, Tag) else 'alignments'
+    return list(Badge.objects.filter(**{field: instance}).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Alignment, dispatch_uid="alignment_post_save_publish")
+@receiver(post_save, sender=Tag, dispatch_uid="tag_post_save_publish")
+def publish_related_badges(sender, instance, **kwargs):
+    if is_enabled():
+        publish_badges(get_related_badges(instance))
+
+
+@receiver(pre_delete, sender=Alignment, dispatch_uid="alignment_pre_delete_publish")
+@receiver(pre_delete, sender=Tag, dispatch_uid="tag_pre_delete_publish")
+def remember_related_badges(sender, instance, **kwargs):
+    # after the delete they aren't related anymore
+    if is_enabled():
+        instance._published_badges = get_related_badges(instance)
+
+
+@receiver(post_delete, sender=Alignment, dispatch_uid="alignment_post_delete_publish")
+@receiver(post_delete, sender=Tag, dispatch_uid="tag_post_delete_publish")
+def publish_unrelated_badges(sender, instance, **kwargs):
+    if is_enabled():
+        publish_badges(getattr(instance, '_published_badges', []))
+
+
+@receiver(m2m_changed, sender=Badge.alignments.through, dispatch_uid="badge_alignments_changed_publish")
+@receiver(m2m_changed, sender=Badge.tags.through, dispatch_uid="badge_tags_changed_publish")
+def publish_changed_badges(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Publishes the badges whose alignments or tags were added or removed,
+    after the change, from either side of the relation. A clear from the
+    alignment or tag side has no pk_set, so its badges are read before it.
+    """
+    if not is_enabled():
+        return
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            publish_badges([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        publish_badges(pk_set)
+    elif action == 'pre_clear':
+        instance._published_badges = get_related_badges(instance)
+    elif action == 'post_clear':
+        publish_badges(getattr(instance, '_published_badges', []))
+
+
+@receiver(post_save, sender=Issuer, dispatch_uid="issuer_post_save_publish")
+@receiver(post_delete, sender=Issuer, dispatch_uid="issuer_post_delete_publish")
+def publish_issuer_document(sender, **kwargs):
+    if is_enabled():
+        publish_issuer()
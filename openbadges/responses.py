@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from django.conf import settings
+from django.core.servers.basehttp import FileWrapper
+from django.http import (HttpResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe
+
+import calendar
+import hashlib
+import re
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CHUNK_SIZE = 8192
+
+
+def to_timestamp(value):
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return calendar.timegm(value.utctimetuple())
+
+
+def make_etag(*parts):
+    return '"{0}"'.format(hashlib.md5(u':'.join(u'{0}'.format(part) for part in parts)
+                                            .encode('utf-8')).hexdigest())
+
+
+def get_cache_control(name):
+    """
+    BADGES_CACHE_CONTROL is the Cache-Control of the OBI documents, or a
+    dict of them by url name ('assertion', 'badge', 'issuer', 'public_key',
+    'revocation_list') with a 'default' one
+    """
+    value = getattr(settings, 'BADGES_CACHE_CONTROL', 'public, max-age=60')
+    if isinstance(value, dict):
+        value = value.get(name, value.get('default'))
+    return value
+
+
+def add_validators(response, etag, last_modified, cache_control):
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if cache_control:
+        response['Cache-Control'] = cache_control
+    return response
+
+
+def not_modified_response(name, etag, last_modified):
+    return add_validators(HttpResponseNotModified(), etag, last_modified,
+                          get_cache_control(name))
+
+
+def document_response(request, name, document):
+    """
+    Response for an OBI document, a dict with the body, status, etag and
+    last_modified (a timestamp or None), answering conditional requests
+    """
+    etag, last_modified = document['etag'], document['last_modified']
+    if not_modified(request, etag, last_modified):
+        return not_modified_response(name, etag, last_modified)
+    response = HttpResponse(document['body'], status=document['status'])
+    return add_validators(response, etag, last_modified, get_cache_control(name))
+
+
+def not_modified(request, etag, last_modified):
+    """
+    True if the client copy is still valid. If-None-Match takes
+    precedence over If-Modified-Since.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag is not None and (if_none_match.strip() == '*' or
+                                     etag in [tag.strip() for tag in if_none_match.split(',')])
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since is not None and last_modified is not None:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and last_modified <= since
+    return False
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single byte range, end included, or None if it can't
+    be satisfied. Multiple ranges are not supported.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if start == '':
+        if end == '':
+            return None
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end != '' else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def iter_file(fileobj, start, length):
+    try:
+        fileobj.seek(start)
+        while length > 0:
+            data = fileobj.read(min(CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        fileobj.close()
+
+
+def serve_image(request, storage, name, modified, cache_control=None):
+    """
+    Serves a png from a storage, as set in BADGES_IMAGE_DELIVERY:
+
+    'python' (default) streams the file from Django, with Range support.
+    'x-accel-redirect' hands it to nginx at BADGES_IMAGE_ACCEL_PREFIX + name.
+    'x-sendfile' hands it to Apache (mod_xsendfile) by its path.
+
+    The url of a baked image stays the same when the award is revoked or
+    awarded again, so by default caches keep it only BADGES_IMAGE_MAX_AGE
+    seconds and revalidate it after.
+    """
+    last_modified = to_timestamp(modified)
+    etag = make_etag(name, last_modified)
+
+    if not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    else:
+        response = deliver_file(request, storage, name)
+    if cache_control is None:
+        cache_control = 'public, max-age={0}, must-revalidate'.format(
+            getattr(settings, 'BADGES_IMAGE_MAX_AGE', 60))
+    return add_validators(response, etag, last_modified, cache_control)
+
+
+def deliver_file(request, storage, name):
+    delivery = getattr(settings, 'BADGES_IMAGE_DELIVERY', 'python')
+    if delivery == 'x-accel-redirect':
+        response = HttpResponse(content_type='image/png')
+        response['X-Accel-Redirect'] = '{0}{1}'.format(
+            getattr(settings, 'BADGES_IMAGE_ACCEL_PREFIX', settings.MEDIA_URL),
+            name)
+        return response
+    if delivery == 'x-sendfile':
+        response = HttpResponse(content_type='image/png')
+        response['X-Sendfile'] = storage.path(name)
+        return response
+
+    size = storage.size(name)
+    byte_range = None
+    if 'HTTP_RANGE' in request.META:
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        if byte_range is None:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{0}'.format(size)
+            return response
+
+    fileobj = storage.open(name, 'rb')
+    if byte_range is None:
+        response = StreamingHttpResponse(FileWrapper(fileobj, CHUNK_SIZE),
+                                         content_type='image/png')
+        response['Content-Length'] = str(size)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(iter_file(fileobj, start, end - start + 1),
+                                         content_type='image/png', status=206)
+        response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, end, size)
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Signed verification of the assertions.
+
+With BADGES_VERIFICATION = 'signed' the awards are signed with the RSA key in
+BADGES_SIGNING_KEY as JWS (RS256, compact serialization) and the signature is
+baked in the image instead of the assertion url, so a backpack can verify
+them with the public key alone. It needs the cryptography package.
+"""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+import base64
+import json
+
+_keys = {}
+
+
+def get_verification_type():
+    return getattr(settings, 'BADGES_VERIFICATION', 'hosted')
+
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=')
+
+
+def get_private_key():
+    """
+    Loads BADGES_SIGNING_KEY, a PEM string or the path of a PEM file, once
+    per process
+    """
+    value = getattr(settings, 'BADGES_SIGNING_KEY', None)
+    if not value:
+        raise ImproperlyConfigured('BADGES_SIGNING_KEY is needed to sign assertions')
+    if _keys.get('source') != value:
+        try:
+            from cryptography.hazmat.backends import default_backend
+            from cryptography.hazmat.primitives import serialization
+        except ImportError:
+            raise ImproperlyConfigured('The cryptography package is needed to sign assertions')
+        if '-----BEGIN' in value:
+            data = value
+        else:
+            with open(value, 'rb') as f:
+                data = f.read()
+        if not isinstance(data, bytes):
+            data = data.encode('ascii')
+        password = getattr(settings, 'BADGES_SIGNING_KEY_PASSWORD', None)
+        if password is not None and not isinstance(password, bytes):
+            password = password.encode('utf-8')
+        key = serialization.load_pem_private_key(data, password, default_backend())
+        public_pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+        _keys.clear()
+        _keys.update({'source': value, 'private': key, 'public_pem': public_pem})
+    return _keys['private']
+
+
+def get_public_key_pem():
+    get_private_key()
+    return _keys['public_pem']
+
+
+def sign(payload):
+    """
+    JWS of the payload dict, as text
+    """
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    key = get_private_key()
+    header = b64encode(json.dumps({'alg': 'RS256'}).encode('utf-8'))
+    body = b64encode(json.dumps(payload, sort_keys=True,
+                                separators=(',', ':')).encode('utf-8'))
+    signing_input = header + b'.' + body
+    signature = key.sign(signing_input, padding.PKCS1v15(), hashes.SHA256())
+    return (signing_input + b'.' + b64encode(signature)).decode('ascii')
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Database backed queue of awards waiting for their image to be baked.
+
+The queue is the Award table itself: awards created with BADGES_BAKING_QUEUE
+are 'pending' and the openbadges_worker command claims and bakes them.
+"""
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+import traceback
+
+from . import cache
+from . import models
+from . import publish
+
+
+def get_max_attempts():
+    return getattr(settings, 'BADGES_BAKING_MAX_ATTEMPTS', 3)
+
+
+def pending_ids(limit):
+    return list(models.Award.objects.filter(baking_status='pending')
+                                    .order_by('pk')
+                                    .values_list('pk', flat=True)[:limit])
+
+
+def claim(award_pk):
+    """
+    Marks the award as processing. Only one worker can claim it.
+    """
+    return models.Award.objects.filter(pk=award_pk, baking_status='pending').update(
+        baking_status='processing', baking_attempts=F('baking_attempts') + 1) == 1
+
+
+def requeue_processing():
+    """
+    Puts back in the queue awards left as processing by a dead worker
+    """
+    return models.Award.objects.filter(baking_status='processing').update(
+        baking_status='pending')
+
+
+def process_award(award_pk):
+    """
+    Bakes the image of a pending award. Returns the resulting status, or
+    None if the award was claimed by other worker.
+    """
+    if not claim(award_pk):
+        return None
+    award = models.Award.objects.select_related('badge').get(pk=award_pk)
+    try:
+        models.bake_award_image(award)
+    except Exception:
+        if award.baking_attempts >= get_max_attempts():
+            status = 'failed'
+        else:
+            status = 'pending'
+        models.Award.objects.filter(pk=award_pk).update(
+            baking_status=status, baking_error=traceback.format_exc())
+        return status
+    # the image url changes the assertion, and so its validators
+    award.modified = timezone.now()
+    models.Award.objects.filter(pk=award_pk).update(
+        image=award.image.name, baking_status='done', baking_error=None,
+        modified=award.modified)
+    cache.delete_entry('assertions', award.uuid)
+    # the badge image urls served the badge image while it was pending
+    cache.bump_version('user:{0}'.format(award.user_id))
+    cache.badge_images.clear()
+    if publish.is_enabled():
+        publish.publish_assertion(award)
+    return 'done'
+
+
+def close_connections():
+    """
+    Forked processes must not share the parent connections
+    """
+    for conn in connections.all():
+        conn.close()
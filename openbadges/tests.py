@@ -0,0 +1,817 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import six, timezone
+
+from PIL import Image
+
+from . import baking
+from . import cache
+from . import counters
+from . import images
+from . import imports
+from . import models
+from . import publish
+from . import responses
+from . import verification
+from .responses import parse_range
+
+
+def make_png(color=(255, 0, 0, 255)):
+    data = io.BytesIO()
+    Image.new('RGBA', (40, 40), color).save(data, 'PNG')
+    return data.getvalue()
+
+
+class BakingTest(TestCase):
+    def assertRoundTrip(self, text):
+        prefix, suffix = baking.split_png(make_png())
+        baked = baking.bake(prefix, suffix, text)
+        image = Image.open(io.BytesIO(baked))
+        image.load()
+        value = image.info['openbadges']
+        if isinstance(value, bytes):
+            # PIL doesn't decode the text chunks on python 2
+            value = value.decode('utf-8')
+        self.assertEqual(value, text)
+        self.assertEqual(image.getpixel((0, 0)), (255, 0, 0, 255))
+        self.assertEqual(baking.extract(baked), text)
+        return baked
+
+    def test_text_chunk(self):
+        baked = self.assertRoundTrip(u'http://example.com/assertion/1/')
+        self.assertIn(b'tEXtopenbadges\x00', baked)
+
+    def test_international_text_chunk(self):
+        baked = self.assertRoundTrip(u'http://example.com/assertion/✓/')
+        self.assertIn(b'iTXtopenbadges\x00', baked)
+
+    def test_rebake_replaces_the_chunk(self):
+        prefix, suffix = baking.split_png(make_png())
+        baked = baking.bake(prefix, suffix, u'http://example.com/1/')
+        prefix, suffix = baking.split_png(baked)
+        rebaked = baking.bake(prefix, suffix, u'http://example.com/2/')
+        self.assertEqual(rebaked.count(b'openbadges'), 1)
+        self.assertEqual(baking.extract(rebaked), u'http://example.com/2/')
+
+    def test_extract_without_chunk(self):
+        self.assertEqual(baking.extract(make_png()), None)
+
+    def test_not_a_png(self):
+        self.assertRaises(ValueError, baking.split_png, b'GIF89a')
+        self.assertRaises(ValueError, baking.extract, make_png()[:40])
+
+
+class ParseRangeTest(TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range(' bytes=0-0 ', 100), (0, 0))
+
+    def test_ranges_past_the_end(self):
+        self.assertEqual(parse_range('bytes=50-500', 100), (50, 99))
+        self.assertEqual(parse_range('bytes=-500', 100), (0, 99))
+        self.assertEqual(parse_range('bytes=100-', 100), None)
+        self.assertEqual(parse_range('bytes=-10', 0), None)
+
+    def test_invalid_ranges(self):
+        self.assertEqual(parse_range('bytes=10-5', 100), None)
+        self.assertEqual(parse_range('bytes=-', 100), None)
+        self.assertEqual(parse_range('bytes=0-1,5-6', 100), None)
+        self.assertEqual(parse_range('items=0-9', 100), None)
+        self.assertEqual(parse_range('', 100), None)
+
+
+@override_settings(BADGES_BASE_URL='http://testserver')
+class AwardTestCase(TestCase):
+    urls = 'openbadges.urls'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        # the rolled back rows leave their documents in the local caches
+        cache.get_badges_cache().clear()
+        cache.badge_images.clear()
+        User = get_user_model()
+        self.users = [User.objects.create(username='user{0}'.format(i),
+                                          email='user{0}@example.com'.format(i))
+                      for i in range(3)]
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def make_badge(self, slug):
+        badge = models.Badge(title=slug, description='Description',
+                             criteria='Criteria', slug=slug)
+        badge.image.save(slug + '.png', ContentFile(make_png()), save=False)
+        badge.save()
+        return badge
+
+    def get_counts(self, badge):
+        badge = models.Badge.objects.get(pk=badge.pk)
+        return badge.awarded_count, badge.revoked_count, badge.active_count
+
+    def get_active(self, user):
+        return models.Identity.objects.get(user=user).active_count
+
+    def assertCountersFixed(self):
+        self.assertEqual(counters.recount_badges(), 0)
+        self.assertEqual(counters.recount_identities(), 0)
+
+
+class BulkAwardTest(AwardTestCase):
+    def assertAward(self, award):
+        award = models.Award.objects.get(pk=award.pk)
+        identity = models.Identity.objects.get(user=award.user_id)
+        self.assertEqual(award.identity_hash, identity.identity_hash)
+        self.assertEqual(award.identity_type, identity.type)
+        self.assertEqual(award.identity_hashed, identity.hashed)
+        self.assertEqual(award.identity_salt, identity.salt)
+        self.assertEqual(award.baking_status, 'done')
+        award.image.open('rb')
+        try:
+            self.assertEqual(baking.extract(award.image.read()), award.get_absolute_url())
+        finally:
+            award.image.close()
+
+    def test_same_as_create(self):
+        created = self.make_badge('created')
+        bulk = self.make_badge('bulk')
+        for user in self.users:
+            self.assertAward(models.Award.objects.create(badge=created, user=user))
+        for award in models.Award.objects.bulk_award(bulk, self.users, batch_size=2):
+            self.assertAward(award)
+
+        self.assertEqual(self.get_counts(created), (3, 0, 3))
+        self.assertEqual(self.get_counts(bulk), self.get_counts(created))
+        for user in self.users:
+            self.assertEqual(self.get_active(user), 2)
+        self.assertCountersFixed()
+
+    def test_skips_awarded_users(self):
+        badge = self.make_badge('badge')
+        models.Award.objects.create(badge=badge, user=self.users[0])
+        awards = models.Award.objects.bulk_award(badge, self.users)
+        self.assertEqual(sorted(award.user_id for award in awards),
+                         [user.pk for user in self.users[1:]])
+        self.assertEqual(self.get_counts(badge), (3, 0, 3))
+        self.assertCountersFixed()
+
+
+class RevocationCountersTest(AwardTestCase):
+    def setUp(self):
+        super(RevocationCountersTest, self).setUp()
+        self.badge = self.make_badge('badge')
+        self.award = models.Award.objects.create(badge=self.badge, user=self.users[0])
+        models.Award.objects.create(badge=self.badge, user=self.users[1])
+
+    def revoke(self, reason='Reason'):
+        return models.Revocation.objects.create(award=self.award, reason=reason)
+
+    def test_create(self):
+        self.revoke()
+        self.assertEqual(self.get_counts(self.badge), (2, 1, 1))
+        self.assertEqual(self.get_active(self.users[0]), 0)
+        # a second revocation of the same award changes nothing
+        self.revoke()
+        self.assertEqual(self.get_counts(self.badge), (2, 1, 1))
+        self.assertEqual(self.get_active(self.users[0]), 0)
+        self.assertCountersFixed()
+
+    def test_delete(self):
+        first = self.revoke()
+        self.revoke()
+        first.delete()
+        self.assertEqual(self.get_counts(self.badge), (2, 1, 1))
+        models.Revocation.objects.get().delete()
+        self.assertEqual(self.get_counts(self.badge), (2, 0, 2))
+        self.assertEqual(self.get_active(self.users[0]), 1)
+        self.assertCountersFixed()
+
+    def test_delete_together(self):
+        self.revoke()
+        self.revoke()
+        models.Revocation.objects.filter(award=self.award).delete()
+        self.assertEqual(self.get_counts(self.badge), (2, 0, 2))
+        self.assertEqual(self.get_active(self.users[0]), 1)
+        self.assertCountersFixed()
+
+    def test_delete_revoked_award(self):
+        self.revoke()
+        self.revoke()
+        models.Award.objects.get(pk=self.award.pk).delete()
+        self.assertEqual(self.get_counts(self.badge), (1, 0, 1))
+        self.assertEqual(self.get_active(self.users[0]), 0)
+        self.assertCountersFixed()
+
+
+class VerifyAssertionsTest(AwardTestCase):
+    def setUp(self):
+        super(VerifyAssertionsTest, self).setUp()
+        self.award = models.Award.objects.create(badge=self.make_badge('badge'),
+                                                 user=self.users[0])
+
+    def verify(self, data):
+        return self.client.post('/verify/', json.dumps(data),
+                                content_type='application/json')
+
+    def test_recipient(self):
+        response = self.verify({'assertions': [self.award.uuid, {'uid': self.award.uuid,
+                                                                 'email': 'user1@example.com'}],
+                                'email': 'user0@example.com'})
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content.decode('utf-8'))['results']
+        self.assertEqual([result['recipient'] for result in results], [True, False])
+
+    def test_email_not_a_string(self):
+        response = self.verify({'assertions': [self.award.uuid], 'email': 5})
+        self.assertEqual(response.status_code, 400)
+        response = self.verify({'assertions': [{'uid': self.award.uuid, 'email': ['x']}]})
+        self.assertEqual(response.status_code, 400)
+
+
+class BadgeImageTest(AwardTestCase):
+    def setUp(self):
+        super(BadgeImageTest, self).setUp()
+        self.badge = self.make_badge('badge')
+        self.award = models.Award.objects.create(badge=self.badge, user=self.users[0])
+        self.url = '/badge_image/badge/{0}/image'.format(self.users[0].pk)
+
+    def test_baked_image(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60, must-revalidate')
+        content = b''.join(response.streaming_content)
+        self.assertEqual(baking.extract(content), self.award.get_absolute_url())
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_awarded_again(self):
+        etag = self.client.get(self.url)['ETag']
+        self.award.delete()
+        award = models.Award.objects.create(badge=self.badge, user=self.users[0])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        self.assertEqual(baking.extract(content), award.get_absolute_url())
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-7')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), baking.PNG_SIGNATURE)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100000-')
+        self.assertEqual(response.status_code, 416)
+
+    @override_settings(BADGES_BAKING_QUEUE=True)
+    def test_pending_image(self):
+        models.Award.objects.create(badge=self.badge, user=self.users[1])
+        response = self.client.get('/badge_image/badge/{0}/image'.format(self.users[1].pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(baking.extract(b''.join(response.streaming_content)), None)
+
+
+class BadgeDocumentTest(AwardTestCase):
+    def setUp(self):
+        super(BadgeDocumentTest, self).setUp()
+        self.badge = self.make_badge('badge')
+        self.backdate()
+        self.tag = models.Tag.objects.create(name='tag')
+
+    def backdate(self):
+        # Last-Modified has a resolution of seconds
+        models.Badge.objects.filter(pk=self.badge.pk).update(
+            modified=timezone.now() - datetime.timedelta(hours=1))
+
+    def get(self, **headers):
+        return self.client.get('/badge/badge/', **headers)
+
+    def assertChanged(self, response):
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+                         200)
+
+    def test_not_modified(self):
+        response = self.get()
+        self.assertEqual(response['ETag'], responses.make_etag(response.content.decode('utf-8')))
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+                         304)
+
+    def test_same_etag_in_every_process(self):
+        etag = self.get()['ETag']
+        # another process has its own cache and versions
+        cache.get_badges_cache().clear()
+        self.assertEqual(self.get()['ETag'], etag)
+
+    def test_tag_added(self):
+        response = self.get()
+        self.badge.tags.add(self.tag)
+        self.assertChanged(response)
+
+    def test_tag_renamed(self):
+        self.badge.tags.add(self.tag)
+        self.backdate()
+        response = self.get()
+        self.tag.name = 'other'
+        self.tag.save()
+        self.assertChanged(response)
+        self.assertIn('other', json.loads(self.get().content.decode('utf-8'))['tags'])
+
+    def test_tag_removed_from_its_side(self):
+        self.badge.tags.add(self.tag)
+        self.backdate()
+        response = self.get()
+        self.tag.tags.clear()
+        self.assertChanged(response)
+
+    def test_alignment_deleted(self):
+        alignment = models.Alignment.objects.create(name='alignment', url='http://example.com')
+        self.badge.alignments.add(alignment)
+        self.backdate()
+        response = self.get()
+        alignment.delete()
+        self.assertChanged(response)
+        self.assertEqual(json.loads(self.get().content.decode('utf-8'))['alignment'], [])
+
+    @override_settings(BADGES_EXPOSE_COUNTS=True)
+    def test_counters_changed(self):
+        response = self.get()
+        models.Award.objects.create(badge=self.badge, user=self.users[0])
+        self.assertChanged(response)
+
+    def test_cached(self):
+        self.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_title_changed(self):
+        self.get()
+        self.badge.title = 'Renamed'
+        self.badge.save()
+        self.assertEqual(json.loads(self.get().content.decode('utf-8'))['name'], 'Renamed')
+
+    def test_slug_changed(self):
+        self.get()
+        self.badge.slug = 'renamed'
+        self.badge.save()
+        self.assertEqual(self.get().status_code, 404)
+        self.assertEqual(self.client.get('/badge/renamed/').status_code, 200)
+
+
+class RevocationListTest(AwardTestCase):
+    def setUp(self):
+        super(RevocationListTest, self).setUp()
+        badge = self.make_badge('badge')
+        self.revocations = [
+            models.Revocation.objects.create(
+                award=models.Award.objects.create(badge=badge, user=user), reason='Reason')
+            for user in self.users]
+        self.backdate()
+
+    def backdate(self):
+        # Last-Modified has a resolution of seconds
+        models.Revocation.objects.update(modified=timezone.now() - datetime.timedelta(hours=1))
+
+    def get(self, **headers):
+        return self.client.get('/revoked/', **headers)
+
+    def get_list(self, response):
+        return json.loads(b''.join(response.streaming_content).decode('utf-8'))
+
+    def assertChanged(self, response):
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+                         200)
+
+    def test_not_modified(self):
+        response = self.get()
+        self.assertEqual(len(self.get_list(response)), 3)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+                         304)
+
+    def test_reason_edited(self):
+        response = self.get()
+        self.revocations[0].reason = 'Other reason'
+        self.revocations[0].save()
+        self.assertChanged(response)
+
+    def test_deleted(self):
+        response = self.get()
+        self.revocations[0].delete()
+        self.assertChanged(response)
+        self.assertEqual(len(self.get_list(self.get())), 2)
+
+    def test_last_deleted(self):
+        response = self.get()
+        self.revocations[-1].delete()
+        self.assertChanged(response)
+
+
+class RevocationCursorTest(AwardTestCase):
+    def setUp(self):
+        super(RevocationCursorTest, self).setUp()
+        self.badge = self.make_badge('badge')
+        self.awards = [models.Award.objects.create(badge=self.badge, user=user)
+                       for user in self.users]
+        for award in self.awards[:2]:
+            models.Revocation.objects.create(award=award, reason='Reason')
+        models.Revocation.objects.update(created=timezone.now() - datetime.timedelta(hours=1))
+
+    def get(self, since=None):
+        response = self.client.get('/revoked/', {'since': since} if since is not None else {})
+        uuids = [list(item)[0] for item in
+                 json.loads(b''.join(response.streaming_content).decode('utf-8'))]
+        return uuids, int(response['X-Revocation-Cursor'])
+
+    def test_cursor(self):
+        uuids, cursor = self.get()
+        self.assertEqual(uuids, [award.uuid for award in self.awards[:2]])
+        self.assertEqual(cursor, models.Revocation.objects.order_by('-pk')[0].pk)
+        self.assertEqual(self.get(cursor), ([], cursor))
+
+    def test_recent_revocations_listed_again(self):
+        uuids, cursor = self.get()
+        models.Revocation.objects.create(award=self.awards[2], reason='Reason')
+        uuids, next_cursor = self.get(cursor)
+        self.assertEqual(uuids, [self.awards[2].uuid])
+        # a revocation with a lower pk may still commit
+        self.assertEqual(next_cursor, cursor)
+        self.assertEqual(self.get(next_cursor)[0], [self.awards[2].uuid])
+
+    @override_settings(BADGES_REVOCATION_CURSOR_GRACE=0)
+    def test_without_grace(self):
+        uuids, cursor = self.get()
+        revocation = models.Revocation.objects.create(award=self.awards[2], reason='Reason')
+        self.assertEqual(self.get(cursor), ([self.awards[2].uuid], revocation.pk))
+
+
+class PublishTest(AwardTestCase):
+    def setUp(self):
+        super(PublishTest, self).setUp()
+        self.root = os.path.join(self.media_root, 'published')
+        self.publish_override = override_settings(BADGES_PUBLISH_ROOT=self.root)
+        self.publish_override.enable()
+        self.badge = self.make_badge('badge')
+        self.other = self.make_badge('other')
+        self.tag = models.Tag.objects.create(name='tag')
+
+    def tearDown(self):
+        self.publish_override.disable()
+        super(PublishTest, self).tearDown()
+
+    def read(self, *parts):
+        path = os.path.join(self.root, *(parts + ('index.json',)))
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def test_assertion(self):
+        award = models.Award.objects.create(badge=self.badge, user=self.users[0])
+        self.assertEqual(self.read('assertion', award.uuid)['uid'], award.uuid)
+        revocation = models.Revocation.objects.create(award=award, reason='Reason')
+        self.assertEqual(self.read('assertion', award.uuid), None)
+        self.assertEqual(self.read('revoked'), [{award.uuid: 'Reason'}])
+        revocation.delete()
+        self.assertEqual(self.read('assertion', award.uuid)['uid'], award.uuid)
+        self.assertEqual(self.read('revoked'), [])
+        award.delete()
+        self.assertEqual(self.read('assertion', award.uuid), None)
+
+    def test_tags_of_one_badge(self):
+        os.remove(os.path.join(self.root, 'badge', 'other', 'index.json'))
+        self.badge.tags.add(self.tag)
+        self.assertEqual(self.read('badge', 'badge')['tags'], ['tag'])
+        self.tag.name = 'renamed'
+        self.tag.save()
+        self.assertEqual(self.read('badge', 'badge')['tags'], ['renamed'])
+        # the badges without the tag aren't published again
+        self.assertEqual(self.read('badge', 'other'), None)
+
+    def test_tag_removed(self):
+        self.badge.tags.add(self.tag)
+        self.tag.tags.clear()
+        self.assertEqual(self.read('badge', 'badge')['tags'], [])
+        self.other.tags.add(self.tag)
+        self.tag.delete()
+        self.assertEqual(self.read('badge', 'other')['tags'], [])
+
+    def test_alignment_added_from_its_side(self):
+        alignment = models.Alignment.objects.create(name='alignment', url='http://example.com')
+        alignment.alignments.add(self.badge)
+        self.assertEqual(self.read('badge', 'badge')['alignment'][0]['name'], 'alignment')
+
+    def test_rebuild(self):
+        award = models.Award.objects.create(badge=self.badge, user=self.users[0])
+        models.Award.objects.create(badge=self.other, user=self.users[0])
+        self.assertEqual(publish.rebuild(chunk_size=1), 2)
+        self.assertEqual(self.read('assertion', award.uuid)['uid'], award.uuid)
+        self.assertEqual(self.read('badge', 'other')['name'], 'other')
+        self.assertEqual(self.read('revoked'), [])
+
+
+class AssertionTest(AwardTestCase):
+    def setUp(self):
+        super(AssertionTest, self).setUp()
+        self.badge = self.make_badge('badge')
+        self.award = models.Award.objects.create(badge=self.badge, user=self.users[0])
+        self.url = '/assertion/{0}/'.format(self.award.uuid)
+
+    def get_document(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_cached(self):
+        self.assertEqual(self.get_document()['uid'], self.award.uuid)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_document()['uid'], self.award.uuid)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        cache.get_badges_cache().clear()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_revoked(self):
+        etag = self.client.get(self.url)['ETag']
+        revocation = models.Revocation.objects.create(award=self.award, reason='Reason')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 410)
+        revocation.delete()
+        self.assertEqual(self.get_document()['uid'], self.award.uuid)
+
+    def test_award_changed(self):
+        self.get_document()
+        models.Award.objects.get(pk=self.award.pk).delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_badge_slug_changed(self):
+        self.get_document()
+        self.badge.slug = 'renamed'
+        self.badge.save()
+        self.assertEqual(self.get_document()['badge'], 'http://testserver/badge/renamed/')
+
+    def test_invalid_uuid(self):
+        self.assertEqual(self.client.get('/assertion/not-a-uuid/').status_code, 404)
+
+
+class IssuerDocumentTest(AwardTestCase):
+    def setUp(self):
+        super(IssuerDocumentTest, self).setUp()
+        # every test starts with an empty document in this process
+        verification.Issuer.document = {}
+        self.issuer = models.Issuer(name='Issuer', url='http://example.com')
+        self.issuer.image.save('issuer.png', ContentFile(make_png()), save=False)
+        self.issuer.save()
+
+    def get(self, **headers):
+        return self.client.get('/organization/', **headers)
+
+    def get_document(self):
+        return json.loads(self.get().content.decode('utf-8'))
+
+    def test_not_modified(self):
+        response = self.get()
+        self.assertEqual(response['ETag'], responses.make_etag(response.content.decode('utf-8')))
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_cached(self):
+        self.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_issuer_saved(self):
+        etag = self.get()['ETag']
+        self.issuer.name = 'Renamed'
+        self.issuer.save()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['name'], 'Renamed')
+
+    def test_issuer_deleted(self):
+        self.get()
+        self.issuer.delete()
+        self.assertEqual(self.get().status_code, 404)
+
+    def test_expired(self):
+        self.get()
+        # changes made by another process don't reach this one's cache
+        models.Issuer.objects.update(name='Renamed')
+        self.assertEqual(self.get_document()['name'], 'Issuer')
+        verification.Issuer.document['expires'] = 0
+        self.assertEqual(self.get_document()['name'], 'Renamed')
+
+
+class ImportTest(AwardTestCase):
+    def setUp(self):
+        super(ImportTest, self).setUp()
+        self.badge = self.make_badge('badge')
+
+    def import_rows(self, rows, on_conflict='skip'):
+        importer = imports.Importer('email', on_conflict)
+        importer.import_chunk(rows)
+        return importer
+
+    def get_evidence(self, user):
+        return models.Award.objects.get(badge=self.badge, user=user).evidence
+
+    def test_created(self):
+        importer = self.import_rows([
+            {'user': 'user0@example.com', 'badge': 'badge', 'evidence': 'http://example.com/0'},
+            {'user': 'user1@example.com', 'badge': 'badge', 'expires': '2030-01-01'},
+        ])
+        self.assertEqual((importer.created, importer.skipped, importer.invalid), (2, 0, 0))
+        self.assertEqual(self.get_evidence(self.users[0]), 'http://example.com/0')
+        award = models.Award.objects.get(badge=self.badge, user=self.users[1])
+        self.assertEqual(award.expires.date(), datetime.date(2030, 1, 1))
+        self.assertEqual(self.get_counts(self.badge), (2, 0, 2))
+        self.assertCountersFixed()
+
+    def test_invalid_rows(self):
+        importer = self.import_rows([
+            {'user': 'unknown@example.com', 'badge': 'badge'},
+            {'user': 'user0@example.com', 'badge': 'unknown'},
+            {'user': 'user1@example.com', 'badge': 'badge', 'expires': 'never'},
+            {'badge': 'badge'},
+            {},
+        ])
+        self.assertEqual((importer.created, importer.skipped, importer.invalid), (0, 0, 5))
+        self.assertFalse(models.Award.objects.exists())
+
+    def test_existing_skipped(self):
+        models.Award.objects.create(badge=self.badge, user=self.users[0], evidence='http://old/')
+        importer = self.import_rows([
+            {'user': 'user0@example.com', 'badge': 'badge', 'evidence': 'http://new/'},
+            {'user': 'user1@example.com', 'badge': 'badge'},
+            {'user': 'user1@example.com', 'badge': 'badge'},
+        ])
+        self.assertEqual((importer.created, importer.skipped, importer.updated), (1, 2, 0))
+        self.assertEqual(self.get_evidence(self.users[0]), 'http://old/')
+        self.assertCountersFixed()
+
+    def test_existing_updated(self):
+        award = models.Award.objects.create(badge=self.badge, user=self.users[0],
+                                            evidence='http://old/')
+        url = '/assertion/{0}/'.format(award.uuid)
+        self.client.get(url)
+        importer = self.import_rows([
+            {'user': 'user0@example.com', 'badge': 'badge', 'evidence': 'http://new/'},
+        ], on_conflict='update')
+        self.assertEqual((importer.created, importer.skipped, importer.updated), (0, 0, 1))
+        self.assertEqual(self.get_evidence(self.users[0]), 'http://new/')
+        document = json.loads(self.client.get(url).content.decode('utf-8'))
+        self.assertEqual(document['evidence'], 'http://new/')
+        self.assertCountersFixed()
+
+    def test_command(self):
+        path = os.path.join(self.media_root, 'awards.csv')
+        with open(path, 'w') as stream:
+            stream.write('user,badge,evidence\n'
+                         'user0@example.com,badge,http://example.com/0\n'
+                         'user1@example.com,badge,\n'
+                         'unknown@example.com,badge,\n')
+        output = six.StringIO()
+        call_command('openbadges_import', path, user_field='email', chunk_size=2,
+                     stdout=output)
+        self.assertIn('3 rows, 2 created, 0 updated, 0 skipped, 1 invalid', output.getvalue())
+        self.assertEqual(self.get_evidence(self.users[0]), 'http://example.com/0')
+        self.assertEqual(self.get_evidence(self.users[1]), None)
+
+
+class ImageCollectionTest(AwardTestCase):
+    def setUp(self):
+        super(ImageCollectionTest, self).setUp()
+        self.badge = self.make_badge('badge')
+        self.award = models.Award.objects.create(badge=self.badge, user=self.users[0])
+        self.storage = images.get_storage()
+        self.orphan = self.storage.save('badges/orphan.png', ContentFile(make_png()))
+        self.nested = self.storage.save('badges/old/nested.png', ContentFile(make_png()))
+        for name in images.iter_files(self.storage, 'badges'):
+            self.backdate(name)
+        self.recent = self.storage.save('badges/recent.png', ContentFile(make_png()))
+
+    def backdate(self, name):
+        mtime = time.time() - 2 * 60 * 60
+        os.utime(self.storage.path(name), (mtime, mtime))
+
+    def test_orphans(self):
+        self.assertEqual(sorted(images.iter_orphans('badges', chunk_size=2)),
+                         sorted([self.orphan, self.nested]))
+
+    def test_command(self):
+        call_command('openbadges_gc_images', stdout=six.StringIO())
+        self.assertFalse(self.storage.exists(self.orphan))
+        self.assertFalse(self.storage.exists(self.nested))
+        self.assertTrue(self.storage.exists(self.recent))
+        self.assertTrue(self.storage.exists(self.badge.image.name))
+        self.assertTrue(self.storage.exists(models.Award.objects.get(pk=self.award.pk).image.name))
+
+    def test_dry_run(self):
+        output = six.StringIO()
+        call_command('openbadges_gc_images', dry_run=True, stdout=output)
+        self.assertIn('2 orphan files found', output.getvalue())
+        self.assertTrue(self.storage.exists(self.orphan))
+
+
+class UUIDTest(AwardTestCase):
+    def setUp(self):
+        super(UUIDTest, self).setUp()
+        self.award = models.Award.objects.create(badge=self.make_badge('badge'),
+                                                 user=self.users[0])
+
+    def test_parse_uuid(self):
+        canonical = '0f1e2d3c-4b5a-6978-8796-a5b4c3d2e1f0'
+        self.assertEqual(models.parse_uuid(canonical), canonical)
+        self.assertEqual(models.parse_uuid(canonical.upper()), canonical)
+        self.assertEqual(models.parse_uuid(canonical.replace('-', '')), canonical)
+        self.assertEqual(models.parse_uuid('not-a-uuid'), None)
+        self.assertEqual(models.parse_uuid(None), None)
+
+    def test_default_uuid(self):
+        self.assertEqual(models.parse_uuid(self.award.uuid), self.award.uuid)
+
+    def test_assertion_any_case(self):
+        for uuid in (self.award.uuid.upper(), self.award.uuid.replace('-', '')):
+            response = self.client.get('/assertion/{0}/'.format(uuid))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content.decode('utf-8'))['uid'], self.award.uuid)
+
+    def test_migrated(self):
+        for dry_run in (True, False):
+            output = six.StringIO()
+            call_command('openbadges_migrate_uuids', dry_run=dry_run, stdout=output)
+            self.assertIn('already have a unique index', output.getvalue())
+
+
+class RecipientTest(AwardTestCase):
+    def setUp(self):
+        super(RecipientTest, self).setUp()
+        self.badge = self.make_badge('badge')
+        self.awards = [models.Award.objects.create(badge=self.badge, user=user)
+                       for user in self.users[:2]]
+
+    def get_pks(self, awards):
+        return sorted(award.pk for award in awards)
+
+    def test_by_email(self):
+        awards = models.Award.objects.for_recipient('user0@example.com')
+        self.assertEqual(self.get_pks(awards), [self.awards[0].pk])
+
+    def test_by_hash(self):
+        award = models.Award.objects.get(pk=self.awards[1].pk)
+        awards = models.Award.objects.for_recipient(identity_hash=award.identity_hash)
+        self.assertEqual(self.get_pks(awards), [award.pk])
+
+    def test_unknown_email(self):
+        self.assertFalse(models.Award.objects.for_recipient('unknown@example.com').exists())
+
+    def test_has_recipient(self):
+        award = models.Award.objects.get(pk=self.awards[0].pk)
+        self.assertTrue(award.has_recipient('user0@example.com'))
+        self.assertFalse(award.has_recipient('user1@example.com'))
+
+    def test_view(self):
+        staff = get_user_model().objects.create(username='staff', is_staff=True)
+        staff.set_password('password')
+        staff.save()
+        self.client.login(username='staff', password='password')
+        self.assertEqual(self.client.get('/recipient/').status_code, 400)
+        response = self.client.get('/recipient/', {'email': 'user1@example.com'})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([award['user'] for award in data['awards']], [self.users[1].pk])
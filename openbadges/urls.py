@@ -1,3 +1,5 @@
+# -*- coding: utf-8 -*-
+
 # Copyright 2013 Rooter Analysis S.L.
 # Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
 # Copyright 2013 Jesús Espino <jespinog@gmail.com>
@@ -14,6 +16,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from django.conf import settings
 from django.conf.urls import patterns, url
 
 from . import views
@@ -22,9 +25,13 @@ urlpatterns = patterns(
     '',
     url(r'^revoked/$', views.RevocationList.as_view(), name='revocation_list'),
     url(r'^organization/$', views.Issuer.as_view(), name='issuer'),
+    url(r'^public_key/$', views.PublicKey.as_view(), name='public_key'),
     url(r'^assertion/(?P<assertion_uuid>[-\w]+)/$', views.Assertion.as_view(), name='assertion'),
+    url(r'^verify/$', views.VerifyAssertions.as_view(), name='verify_assertions'),
+    url(r'^recipient/$', views.RecipientAwards.as_view(), name='recipient_awards'),
     url(r'^criterion/(?P<criterion_slug>[-\w]+)/$', views.Criterion.as_view(), name='criterion'),
     url(r'^badge/(?P<badge_slug>[-\w]+)/$', views.Badge.as_view(), name='badge'),
+    url(r'^export/(?P<kind>assertions|badges|revocations)/$', views.Export.as_view(), name='export'),
 
     url(r'^user_badges/(?P<user_pk>[\d]+)/?$', views.UserBadges.as_view(), {'mode': 'id'}, name='user_badges', ),
     url(r'^user_badge/(?P<badge_slug>[-\w]+)/(?P<user_pk>[\d]+)/?$', views.UserBadge.as_view(), {'mode': 'id'}, name='user_badge', ),
@@ -34,3 +41,9 @@ urlpatterns = patterns(
     url(r'^user_badge_email/(?P<badge_slug>[-\w]+)/(?P<user_pk>[^/]+)/?$', views.UserBadge.as_view(), {'mode': 'email'}, name='user_badge_email'),
     url(r'^badge_image_email/(?P<badge_slug>[-\w]+)/(?P<user_pk>[^/]+)/image/?$', views.BadgeImage.as_view(), {'mode': 'email'}, name='badge_image_email'),
 )
+
+if getattr(settings, 'BADGES_METRICS', False):
+    urlpatterns += patterns(
+        '',
+        url(r'^metrics/?$', views.Metrics.as_view(), name='openbadges_metrics'),
+    )
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Views of the hosted verification documents. They only need the models and
+the serializers, so openbadges.verification_urls serves them without the
+templates, forms or admin that the rest of openbadges.views imports.
+"""
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest,
+                         StreamingHttpResponse)
+from django.utils import six, timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import View
+
+from . import cache
+from . import metrics
+from . import models
+from . import responses
+from . import signing
+import datetime
+import json
+import time
+
+
+def get_or_404(queryset, **kwargs):
+    # django.shortcuts would load the template system
+    try:
+        return queryset.get(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404
+
+
+class BaseView(View):
+    def dispatch(self, request, *args, **kwargs):
+        with metrics.track_view(self.__class__.__name__):
+            return super(BaseView, self).dispatch(request, *args, **kwargs)
+
+
+class Badge(BaseView):
+    def get(self, request, badge_slug):
+        document = cache.get_entry('badges', badge_slug)
+        if document is None:
+            document = get_or_404(models.Badge.objects.all(), slug=badge_slug).to_document()
+        return responses.document_response(request, 'badge', document)
+
+
+class RevocationList(BaseView):
+    """
+    Streamed list of revocations. With ?since=<cursor> only the revocations
+    after the cursor returned in the X-Revocation-Cursor header of a previous
+    response are listed, which may repeat some of the ones already listed.
+    """
+    def get(self, request):
+        try:
+            since = int(request.GET.get('since', 0))
+        except ValueError:
+            return HttpResponseBadRequest()
+        # revocations created while streaming are left for the next cursor
+        state = models.Revocation.objects.aggregate(last=Max('pk'), count=Count('pk'),
+                                                    changed=Max('modified'))
+        until = state['last'] or 0
+        # creating, editing and deleting revocations move the last
+        # modification, a deletion dates the last revocation left
+        etag = responses.make_etag(since, until, state['count'], state['changed'])
+        last_modified = state['changed'] and responses.to_timestamp(state['changed'])
+
+        if responses.not_modified(request, etag, last_modified):
+            response = responses.not_modified_response('revocation_list', etag,
+                                                       last_modified)
+        else:
+            response = StreamingHttpResponse(models.Revocation.objects.iter_json(since, until))
+            responses.add_validators(response, etag, last_modified,
+                                     responses.get_cache_control('revocation_list'))
+        response['X-Revocation-Cursor'] = str(self.get_cursor(since, until))
+        return response
+
+    def get_cursor(self, since, until):
+        """
+        Revocations take their pk when inserted but are seen when committed,
+        so one with a lower pk can appear after a higher one. The cursor
+        stops before the revocations of the last
+        BADGES_REVOCATION_CURSOR_GRACE seconds (60 by default), which the
+        next request lists again, so transactions shorter than that are
+        never skipped.
+        """
+        grace = getattr(settings, 'BADGES_REVOCATION_CURSOR_GRACE', 60)
+        settled = (models.Revocation.objects
+                   .filter(pk__gt=since, pk__lte=until)
+                   .filter(Q(created__lt=timezone.now() - datetime.timedelta(seconds=grace)) |
+                           Q(created__isnull=True))
+                   .order_by('-pk').values_list('pk', flat=True).first())
+        return settled or since
+
+
+class Issuer(BaseView):
+    """
+    The issuer document is kept in memory by every process, and rebuilt when
+    the 'issuer' version in the shared cache changes or, as the default cache
+    isn't shared, after the cache timeout
+    """
+    document = {}
+
+    def get(self, request):
+        version = cache.get_version('issuer')
+        if self.document.get('version') != version or self.document['expires'] < time.time():
+            issuer = models.Issuer.objects.all()[:1]
+            if not issuer:
+                raise Http404
+            body = json.dumps(issuer[0].to_dict())
+            Issuer.document = {
+                'version': version,
+                'expires': time.time() + cache.get_timeout(),
+                'status': 200,
+                'body': body,
+                'etag': responses.make_etag(body),
+                'last_modified': None,
+            }
+        return responses.document_response(request, 'issuer', self.document)
+
+
+class PublicKey(BaseView):
+    """
+    Public key of the signed assertions, kept in memory by every process
+    """
+    document = {}
+
+    def get(self, request):
+        if not getattr(settings, 'BADGES_SIGNING_KEY', None):
+            raise Http404
+        if self.document.get('source') != settings.BADGES_SIGNING_KEY:
+            body = signing.get_public_key_pem().decode('ascii')
+            PublicKey.document = {
+                'source': settings.BADGES_SIGNING_KEY,
+                'status': 200,
+                'body': body,
+                'etag': responses.make_etag(body),
+                'last_modified': None,
+            }
+        response = responses.document_response(request, 'public_key', self.document)
+        if response.status_code == 200:
+            response['Content-Type'] = 'application/x-pem-file'
+        return response
+
+
+class Assertion(BaseView):
+    def get(self, request, assertion_uuid):
+        assertion_uuid = models.parse_uuid(assertion_uuid)
+        if assertion_uuid is None:
+            raise Http404
+        document = cache.get_entry('assertions', assertion_uuid)
+        if document is None:
+            assertion = get_or_404(models.Award.objects.with_status().select_related('badge'),
+                                   uuid=assertion_uuid)
+            etag, last_modified = assertion.get_validators()
+            if responses.not_modified(request, etag, last_modified):
+                return responses.not_modified_response('assertion', etag, last_modified)
+            document = assertion.to_document()
+        return responses.document_response(request, 'assertion', document)
+
+
+class VerifyAssertions(BaseView):
+    """
+    Verification of a batch of assertions with one query. The body is a JSON
+    object with the list of "assertions" uuids (or objects with "uid" and
+    "email") and optionally the "email" of the recipient of all of them.
+    """
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        return super(VerifyAssertions, self).dispatch(request, *args, **kwargs)
+
+    def post(self, request):
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+            items = [item if isinstance(item, dict) else {'uid': item}
+                     for item in data['assertions']]
+            uuids = [models.parse_uuid(item['uid']) for item in items]
+            emails = [item.get('email', data.get('email')) for item in items]
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return HttpResponseBadRequest()
+        if any(email is not None and not isinstance(email, six.string_types)
+               for email in emails):
+            return HttpResponseBadRequest('The emails must be strings')
+        max_batch = getattr(settings, 'BADGES_VERIFY_MAX_BATCH', 1000)
+        if len(uuids) > max_batch:
+            return HttpResponseBadRequest('At most {0} assertions'.format(max_batch))
+
+        awards = dict((award.uuid, award) for award in
+                      models.Award.objects.with_status().select_related('badge')
+                                          .filter(uuid__in=[pk for pk in uuids if pk]))
+        results = []
+        for item, award_uuid, email in zip(items, uuids, emails):
+            award = awards.get(award_uuid)
+            if award is None:
+                results.append({'uid': item['uid'], 'found': False})
+                continue
+            result = {
+                'uid': award.uuid,
+                'found': True,
+                'revoked': award.revoked,
+                'expired': award.expired,
+                'assertion': award.to_dict(),
+            }
+            if email is not None:
+                result['recipient'] = award.has_recipient(email)
+            results.append(result)
+        return HttpResponse(json.dumps({'results': results}),
+                            content_type='application/json')
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+URLconf with only the verification documents, for workers that serve them
+without the rest of the application (see openbadges.wsgi). The urls get the
+same names and, with BADGES_VERIFICATION_PREFIX, the same paths as where
+openbadges.urls is included, so the documents link to the same places.
+"""
+
+from django.conf import settings
+from django.conf.urls import include, patterns, url
+
+from . import verification
+
+verification_patterns = patterns(
+    '',
+    url(r'^revoked/$', verification.RevocationList.as_view(), name='revocation_list'),
+    url(r'^organization/$', verification.Issuer.as_view(), name='issuer'),
+    url(r'^public_key/$', verification.PublicKey.as_view(), name='public_key'),
+    url(r'^assertion/(?P<assertion_uuid>[-\w]+)/$', verification.Assertion.as_view(), name='assertion'),
+    url(r'^verify/$', verification.VerifyAssertions.as_view(), name='verify_assertions'),
+    url(r'^badge/(?P<badge_slug>[-\w]+)/$', verification.Badge.as_view(), name='badge'),
+)
+
+urlpatterns = patterns(
+    '',
+    url(r'^' + getattr(settings, 'BADGES_VERIFICATION_PREFIX', ''), include(verification_patterns)),
+)
@@ -16,94 +16,191 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse, HttpResponseGone
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render_to_response
 from django.template import RequestContext
+from django.utils.decorators import method_decorator
 from django.views.generic import View
 
+from . import cache
+from . import export
+from . import metrics
 from . import models
+from . import responses
+# the verification views are served also by openbadges.verification_urls
+from .verification import (Assertion, Badge, BaseView, Issuer, PublicKey,  # NOQA
+                           RevocationList, VerifyAssertions)
+import hashlib
 import json
 
 
-class UserBadges(View):
+class UserBadges(BaseView):
+    """
+    Awards of a user, newest first, in pages of BADGES_USER_BADGES_PAGE_SIZE.
+    The next page is requested with ?cursor=<next> and ?format=json returns
+    the page as JSON.
+    """
     def get(self, request, user_pk, mode):
         if mode == 'email':
             user = get_object_or_404(get_user_model(), email=user_pk)
         else:
             user = get_object_or_404(get_user_model(), id=user_pk)
         try:
-            award_list = models.Award.objects.filter(user=user)
-            return render_to_response('badges/user_badges.html', {
-                'award_list': award_list,
-                'user': user,
-            }, context_instance=RequestContext(request))
-        except models.Award.DoesNotExist:
-            return HttpResponse(status=404)
-
-
-class UserBadge(View):
+            cursor = int(request.GET.get('cursor', 0))
+        except ValueError:
+            return HttpResponseBadRequest()
+
+        page = self.get_page(user, cursor)
+        if request.GET.get('format') == 'json':
+            return HttpResponse(json.dumps(page), content_type='application/json')
+        return render_to_response('badges/user_badges.html', {
+            'award_list': page['awards'],
+            'next': page['next'],
+            'user': user,
+        }, context_instance=RequestContext(request))
+
+    def get_page(self, user, cursor):
+        namespace = 'user:{0}'.format(user.pk)
+        # the rows show badge fields, so they also depend on the badges
+        name = '{0}:{1}'.format(cursor, cache.get_version('badges'))
+        page = cache.get_entry(namespace, name)
+        if page is None:
+            page_size = getattr(settings, 'BADGES_USER_BADGES_PAGE_SIZE', 50)
+            awards = models.Award.objects.with_status().filter(user=user)
+            awards = awards.select_related('badge').order_by('-pk')
+            if cursor:
+                awards = awards.filter(pk__lt=cursor)
+            awards = list(awards[:page_size + 1])
+            for award in awards:
+                award.user = user
+            page = {
+                'awards': [a.to_summary_dict() for a in awards[:page_size]],
+                'next': len(awards) > page_size and awards[page_size - 1].pk or None,
+            }
+            cache.set_entry(namespace, name, page)
+        return page
+
+
+class UserBadge(BaseView):
     def get(self, request, badge_slug, user_pk, mode):
-        badge = get_object_or_404(models.Badge, slug=badge_slug)
-        if mode == 'email':
-            user = get_object_or_404(get_user_model(), email=user_pk)
-        else:
-            user = get_object_or_404(get_user_model(), id=user_pk)
-        try:
-            award = get_object_or_404(models.Award, badge=badge, user=user)
-            return render_to_response('badges/user_badge.html', {
-                'award': award,
-                'user': user,
-            }, context_instance=RequestContext(request))
-        except models.Award.DoesNotExist:
-            return HttpResponse(status=404)
+        award = get_object_or_404(models.Award.objects.select_related('badge', 'user')
+                                                      .for_badge_and_user(badge_slug, user_pk, mode))
+        return render_to_response('badges/user_badge.html', {
+            'award': award,
+            'user': award.user,
+        }, context_instance=RequestContext(request))
 
 
-class BadgeImage(View):
+class BadgeImage(BaseView):
     def get(self, request, badge_slug, user_pk, mode):
-        badge = get_object_or_404(models.Badge, slug=badge_slug)
-        if mode == 'email':
-            user = get_object_or_404(get_user_model(), email=user_pk)
-        else:
-            user = get_object_or_404(get_user_model(), id=user_pk)
-        try:
-            models.Award.objects.filter(user=user).get(badge=badge)
-            return HttpResponse(badge.image.read(), content_type="image/png")
-        except models.Award.DoesNotExist:
+        entry = self.get_entry(badge_slug, user_pk, mode)
+        if entry is None:
             return HttpResponse(status=404)
+        if entry['baked']:
+            return responses.serve_image(request, models.Award._meta.get_field('image').storage,
+                                         entry['name'], entry['modified'])
+        # the badge image, until the award image is baked
+        return responses.serve_image(request, models.Badge._meta.get_field('image').storage,
+                                     entry['name'], entry['modified'], 'no-cache')
+
+    def get_entry(self, badge_slug, user_pk, mode):
+        """
+        Image name of the award, from the in-process LRU, the shared cache
+        or one joined query, in this order
+        """
+        key = hashlib.md5(u'{0}:{1}:{2}'.format(badge_slug, mode, user_pk)
+                                         .encode('utf-8')).hexdigest()
+        entry = cache.badge_images.get(key)
+        if entry is not None:
+            return entry
+
+        entry = cache.get_entry('badge_images', key)
+        if (entry is None or
+                entry['version'] != cache.get_version('user:{0}'.format(entry['user']))):
+            try:
+                award = (models.Award.objects.select_related('badge')
+                                             .for_badge_and_user(badge_slug, user_pk, mode)
+                                             .get())
+            except models.Award.DoesNotExist:
+                return None
+            # the award image is baked, the badge one is served until it is
+            baked = bool(award.image)
+            image = baked and award.image or award.badge.image
+            entry = {
+                'user': award.user_id,
+                'version': cache.get_version('user:{0}'.format(award.user_id)),
+                'baked': baked,
+                'name': image.name,
+                'modified': baked and award.modified or award.badge.modified,
+            }
+            cache.set_entry('badge_images', key, entry)
+        cache.badge_images.set(key, entry)
+        return entry
+
+
+class RecipientAwards(BaseView):
+    """
+    Awards of a recipient for staff, by ?email= or by ?hash= (sha256$...)
+    """
+    @method_decorator(staff_member_required)
+    def dispatch(self, request, *args, **kwargs):
+        return super(RecipientAwards, self).dispatch(request, *args, **kwargs)
 
-
-class Badge(View):
-    def get(self, request, badge_slug):
-        badge = get_object_or_404(models.Badge, slug=badge_slug)
-        return HttpResponse(json.dumps(badge.to_dict()))
-
-
-class RevocationList(View):
     def get(self, request):
-        revocations = [r.to_dict() for r in models.Revocation.objects.all()]
-
-        return HttpResponse(json.dumps(revocations))
-
-
-class Issuer(View):
-    def get(self, request):
-        issuer = models.Issuer.objects.all()[0].to_dict()
-        return HttpResponse(json.dumps(issuer))
-
+        email = request.GET.get('email')
+        identity_hash = request.GET.get('hash')
+        if not email and not identity_hash:
+            return HttpResponseBadRequest()
+        awards = (models.Award.objects.for_recipient(email, identity_hash or None)
+                                      .with_status().select_related('badge', 'user'))
+        data = [dict(award.to_summary_dict(), user=award.user_id) for award in awards]
+        return HttpResponse(json.dumps({'awards': data}), content_type='application/json')
 
-class Assertion(View):
-    def get(self, request, assertion_uuid):
-        assertion = get_object_or_404(models.Award, uuid=assertion_uuid)
-        if assertion.revoked:
-            return HttpResponseGone(json.dumps({'revoked': True}))
 
-        return HttpResponse(json.dumps(assertion.to_dict()))
-
-
-class Criterion(View):
+class Criterion(BaseView):
     def get(self, request, criterion_slug):
         criterion = get_object_or_404(models.Criterion, slug=criterion_slug)
         context = {'criterion': criterion}
         return render_to_response('badges/criterion.html', context,
                                   context_instance=RequestContext(request))
+
+
+class Metrics(View):
+    def get(self, request):
+        gauges = {
+            'openbadges_baking_queue_depth':
+                models.Award.objects.filter(baking_status='pending').count(),
+        }
+        return HttpResponse(metrics.render(gauges),
+                            content_type='text/plain; version=0.0.4')
+
+
+class Export(BaseView):
+    """
+    Streamed JSON Lines export for staff, resumed with ?after=<id> or
+    ?after_uuid=<uuid> and compressed with ?gzip=1
+    """
+    @method_decorator(staff_member_required)
+    def dispatch(self, request, *args, **kwargs):
+        return super(Export, self).dispatch(request, *args, **kwargs)
+
+    def get(self, request, kind):
+        try:
+            after = export.resolve_cursor(kind, request.GET.get('after'),
+                                          request.GET.get('after_uuid'))
+        except (ValueError, models.Award.DoesNotExist):
+            return HttpResponseBadRequest()
+
+        stream = export.iter_lines(kind, after)
+        filename = '{0}.jsonl'.format(kind)
+        if request.GET.get('gzip'):
+            stream = export.gzip_stream(stream)
+            response = StreamingHttpResponse(stream, content_type='application/gzip')
+            filename += '.gz'
+        else:
+            response = StreamingHttpResponse(stream, content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename={0}'.format(filename)
+        return response
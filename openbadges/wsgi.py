@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Rooter Analysis S.L.
+# Copyright 2013 Yamila Moreno <yamila.moreno@kaleidos.net>
+# Copyright 2013 Jesús Espino <jespinog@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+WSGI entry point of the verification workers:
+
+    gunicorn openbadges.wsgi:application
+
+Every request is resolved with openbadges.verification_urls instead of the
+ROOT_URLCONF of the project, so the project urls, and with them the admin
+registration, are never imported.
+"""
+
+from django.core.handlers.wsgi import WSGIHandler
+
+import django
+
+
+class VerificationHandler(WSGIHandler):
+    urlconf = 'openbadges.verification_urls'
+
+    def get_response(self, request):
+        # honoured by the handler as if a middleware had set it
+        request.urlconf = self.urlconf
+        return super(VerificationHandler, self).get_response(request)
+
+
+def get_verification_application():
+    """
+    Like django.core.wsgi.get_wsgi_application, which loads the app
+    registry first on Django >= 1.7
+    """
+    if hasattr(django, 'setup'):
+        django.setup()
+    return VerificationHandler()
+
+
+application = get_verification_application()
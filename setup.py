@@ -21,10 +21,14 @@ CLASSIFIERS = [
 ]
 
 REQUIREMENTS = [
-    'Django >= 1.3',
+    'Django >= 1.6',
     'pillow >= 1.7.8',
 ]
 
+EXTRAS = {
+    'signed': ['cryptography'],
+}
+
 setup(name='django-openbadges',
       author='Yamila Moreno',
       author_email='yamila.moreno@kaleidos.net',
@@ -38,4 +42,5 @@ setup(name='django-openbadges',
       include_package_data=True,
       classifiers=CLASSIFIERS,
       install_requires=REQUIREMENTS,
+      extras_require=EXTRAS,
       platforms=['any'])